@@ -107,6 +107,10 @@ players = nflgame.player._create_players()
 """
 A dict of all players and meta information about each player keyed
 by GSIS ID. (The identifiers used by NFL.com GameCenter.)
+
+This is a `nflgame.player.Players` mapping, which reads the player
+database the first time it is used and creates each `nflgame.player.Player`
+object the first time it is looked up.
 """
 
 teams = [
@@ -151,18 +155,49 @@ team abbreviation (two or three letters).
 """
 
 
-def find(name, team=None):
+_team_variants = None
+"""
+A dict mapping every variant of a team name in `nflgame.teams`, case
+folded, to the team's standard abbreviation. It is rebuilt whenever
+`nflgame.teams` changes size.
+"""
+
+_team_variants_size = None
+
+
+def find(name, team=None, match='exact'):
     """
     Finds a player (or players) with a name matching (case insensitive)
     name and returns them as a list.
 
     If team is not None, it is used as an additional search constraint.
+
+    The match parameter decides how names are compared. When it is
+    `exact`, name must be a player's full name (e.g., "Tom Brady"). When it
+    is `gsis`, name must be a player's GSIS name (e.g., "T.Brady"). When it
+    is `prefix`, name must be the start of a player's full name, GSIS name
+    or last name. When it is `fuzzy`, name
+    must be similar to one of those names (e.g., "Tom Bardy"), and players
+    are returned from most to least similar.
+
+    Players are looked up in indexes that are built the first time this is
+    called.
     """
-    hits = []
-    for player in players.itervalues():
-        if player.name.lower() == name.lower():
-            if team is None or team.lower() == player.team.lower():
-                hits.append(player)
+    index = players.index()
+    if match == 'exact':
+        hits = index.exact(name)
+    elif match == 'gsis':
+        hits = index.gsis(name)
+    elif match == 'prefix':
+        hits = index.prefix(name)
+    elif match == 'fuzzy':
+        hits = index.fuzzy(name)
+    else:
+        raise ValueError('Unknown match "%s". Valid values are exact, '
+                         'gsis, prefix and fuzzy.' % match)
+    if team is not None:
+        team = team.lower()
+        hits = [p for p in hits if p.team.lower() == team]
     return hits
 
 
@@ -172,15 +207,19 @@ def standard_team(team):
     nflgame.teams (case insensitive).  All known variants of a team name are
     searched. If no team is found, None is returned.
     """
-    team = team.lower()
-    for variants in teams:
-        for variant in variants:
-            if team == variant.lower():
-                return variants[0]
-    return None
+    global _team_variants, _team_variants_size
 
+    if _team_variants is None or _team_variants_size != len(teams):
+        variants = {}
+        for names in reversed(teams):
+            for variant in reversed(names):
+                variants[variant.lower()] = names[0]
+        _team_variants, _team_variants_size = variants, len(teams)
+    return _team_variants.get(team.lower())
 
-def games(year, week=None, home=None, away=None, kind='REG', started=False):
+
+def games(year, week=None, home=None, away=None, kind='REG', started=False,
+          workers=None, ordered=True, prefetch=None):
     """
     games returns a list of all games matching the given criteria. Each
     game can then be queried for player statistics and information about
@@ -216,12 +255,24 @@ def games(year, week=None, home=None, away=None, kind='REG', started=False):
     started parameter requires pytz to be installed. This is useful when
     you only want to collect stats from games that have JSON data available
     (as opposed to waiting for a 404 error from NFL.com).
+
+    If workers is set to a number greater than 1, then games that aren't
+    on disk yet are downloaded from NFL.com by a pool of that many
+    processes, so that the downloads overlap with each other and with
+    decoding the games that have arrived. Games are returned in the order
+    of the schedule unless ordered is False, in which case they are
+    returned as soon as they are loaded.
+
+    The prefetch parameter is accepted for symmetry with games_gen, but
+    since every game is loaded before games returns, it has no benefit.
     """
-    return list(games_gen(year, week, home, away, kind, started))
+    return list(games_gen(year, week, home, away, kind, started,
+                          workers, ordered, prefetch))
 
 
 def games_gen(year, week=None, home=None, away=None,
-              kind='REG', started=False):
+              kind='REG', started=False, workers=None, ordered=True,
+              prefetch=None):
     """
     games returns a generator of all games matching the given criteria. Each
     game can then be queried for player statistics and information about
@@ -257,10 +308,29 @@ def games_gen(year, week=None, home=None, away=None,
     started parameter requires pytz to be installed. This is useful when
     you only want to collect stats from games that have JSON data available
     (as opposed to waiting for a 404 error from NFL.com).
+
+    If workers is set to a number greater than 1, then games that aren't
+    on disk yet are downloaded from NFL.com by a pool of that many
+    processes, so that the downloads overlap with each other and with
+    decoding the games that have arrived. Games are returned in the order
+    of the schedule unless ordered is False, in which case they are
+    returned as soon as they are loaded.
+
+    If prefetch is set to a positive number, then a background thread
+    loads up to that many games ahead while the caller works on the
+    current game. This overlaps loading games with processing them without
+    holding every game in memory. It is ignored when workers is set, since
+    a pool of workers already loads games ahead.
     """
     infos = _search_schedule(year, week, home, away, kind, started)
     if not infos:
         return None
+    if workers is not None and workers > 1:
+        eids = [info['eid'] for info in infos]
+        return nflgame.game._load_parallel(eids, workers, ordered)
+    if prefetch is not None and prefetch > 0:
+        eids = [info['eid'] for info in infos]
+        return nflgame.game._load_prefetch(eids, prefetch)
 
     def gen():
         for info in infos:
@@ -345,9 +415,17 @@ def combine_game_stats(games):
     This can be used, for example, to get GamePlayerStats objects corresponding
     to statistics across an entire week, some number of weeks or an entire
     season.
+
+    games may be any iterable, such as a generator returned by
+    `nflgame.games_gen`. Statistics are summed in a single pass with a
+    `nflgame.player.Accumulator`, so games don't need to be kept in
+    memory.
     """
-    return reduce(lambda ps1, ps2: ps1 + ps2,
-                  [g.players for g in games if g is not None])
+    acc = nflgame.player.Accumulator()
+    for g in games:
+        if g is not None:
+            acc.add_all(g.players)
+    return acc.players()
 
 
 def combine_play_stats(games):
@@ -365,9 +443,14 @@ def combine_play_stats(games):
 
     N.B. Since this combines *all* play data, this function may take a while
     to complete depending on the number of games passed in.
+
+    Like `nflgame.combine_game_stats`, games may be any iterable.
     """
-    return reduce(lambda p1, p2: p1 + p2,
-                  [g.drives.players() for g in games if g is not None])
+    acc = nflgame.player.Accumulator()
+    for g in games:
+        if g is not None:
+            acc.add_all(g.drives.players())
+    return acc.players()
 
 
 def combine_max_stats(games):
@@ -381,9 +464,14 @@ def combine_max_stats(games):
 
     This function should be used in lieu of combine_game_stats or
     combine_play_stats when the best possible accuracy is desired.
+
+    Like `nflgame.combine_game_stats`, games may be any iterable.
     """
-    return reduce(lambda a, b: a + b,
-                  [g.max_player_stats() for g in games if g is not None])
+    acc = nflgame.player.Accumulator()
+    for g in games:
+        if g is not None:
+            acc.add_all(g.max_player_stats())
+    return acc.players()
 
 
 def combine_plays(games):
@@ -424,8 +512,16 @@ def _search_schedule(year, week=None, home=None, away=None, kind='REG',
     you only want to collect stats from games that have JSON data available
     (as opposed to waiting for a 404 error from NFL.com).
     """
+    index = nflgame.sched.index()
+    candidates = sorted(set(index.candidates(year, week, home, away, kind)),
+                        key=index.position.__getitem__)
+
+    if started:
+        now = nflgame.live._now()
+
     infos = []
-    for info in nflgame.sched.games.itervalues():
+    for gsis_id in candidates:
+        info = nflgame.sched.games[gsis_id]
         y, t, w = info['year'], info['season_type'], info['week']
         h, a = info['home'], info['away']
         if year is not None:
@@ -450,7 +546,6 @@ def _search_schedule(year, week=None, home=None, away=None, kind='REG',
             continue
         if started:
             gametime = nflgame.live._game_datetime(info)
-            now = nflgame.live._now()
             if gametime > now and (gametime - now).total_seconds() > 300:
                 continue
         infos.append(info)
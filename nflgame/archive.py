@@ -0,0 +1,240 @@
+"""
+The archive module provides a packed alternative to the directory of
+gzipped GameCenter JSON files that ships with nflgame.
+
+An archive is a single file containing the compressed JSON data of many
+games along with an index mapping each game identifier to the offset and
+length of its data. Reading a game from an archive therefore costs a seek
+and a read on a file that is already open, rather than a permission check,
+an open and a close on a file of its own.
+
+Archives live in the same directory as the gzipped JSON files. There may
+be one archive per season (e.g., `2012.pack`) or one archive for every
+game (`all.pack`). When reading game data, the season archive is tried
+first, then the full archive and finally the individual gzipped file.
+Games cached to disk after an archive was built continue to be written as
+individual gzipped files, so an archive never needs to be rebuilt for
+nflgame to keep working.
+
+An archive can be built from the existing directory with the
+`nflgame-build-archive` script.
+
+The format of an archive is simple. It starts with an 8 byte magic
+string. It is followed by the gzipped JSON data of each game, exactly as
+it appears in the `EID.json.gz` files. Next is the index, which is a JSON
+object mapping game identifiers to a list `[offset, length]`. Finally, the
+last 16 bytes of the file are the offset of the index as a big endian
+unsigned 64 bit integer followed by the magic string again.
+"""
+from __future__ import absolute_import, division, print_function
+import argparse
+import json
+import os
+import os.path as path
+import struct
+import threading
+import zlib
+
+import nflgame.datafile
+
+_MAGIC = 'NFLGPAK1'
+"""The magic string at the start and end of every archive."""
+
+_TRAILER = struct.Struct('>Q')
+"""The encoding of the index offset at the end of every archive."""
+
+
+class Archive (object):
+    """
+    Archive provides read access to the games stored in a single packed
+    archive file.
+
+    The file is opened once and kept open. Reads are serialized with a
+    lock, and the file is transparently reopened in child processes so
+    that forked processes never share a file offset with their parent.
+    """
+    def __init__(self, fpath):
+        self.fpath = fpath
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fp = None
+        self.index = self._read_index()
+
+    def _file(self):
+        if self._pid != os.getpid():
+            self._fp = open(self.fpath, 'rb')
+            self._pid = os.getpid()
+        return self._fp
+
+    def _read_index(self):
+        with self._lock:
+            fp = self._file()
+            fp.seek(-(_TRAILER.size + len(_MAGIC)), os.SEEK_END)
+            end = fp.tell()
+            trailer = fp.read()
+            if trailer[_TRAILER.size:] != _MAGIC:
+                raise IOError('"%s" is not an nflgame archive.' % self.fpath)
+            start = _TRAILER.unpack(trailer[:_TRAILER.size])[0]
+            fp.seek(start)
+            index = json.loads(fp.read(end - start))
+        return dict((eid, tuple(loc)) for eid, loc in index.iteritems())
+
+    def __contains__(self, eid):
+        return eid in self.index
+
+    def raw(self, eid):
+        """
+        Returns the gzipped JSON data of the game identified by eid, or
+        None if the game is not in this archive.
+        """
+        if eid not in self.index:
+            return None
+        offset, length = self.index[eid]
+        with self._lock:
+            fp = self._file()
+            fp.seek(offset)
+            return fp.read(length)
+
+    def read(self, eid):
+        """
+        Returns the decompressed JSON data of the game identified by eid,
+        or None if the game is not in this archive.
+        """
+        blob = self.raw(eid)
+        if blob is None:
+            return None
+        return zlib.decompress(blob, 16 + zlib.MAX_WBITS)
+
+
+_archives = nflgame.datafile.SeasonFiles('pack', Archive,
+                                         (IOError, ValueError))
+"""The archives that have been opened."""
+
+
+def archive_path(season=None, archive_dir=None):
+    """
+    Returns the path of the archive for season. If season is None, then
+    the path of the archive containing every game is returned.
+    """
+    return _archives.path(season, archive_dir)
+
+
+def find(eid):
+    """
+    Returns the archive containing the game identified by eid, or None
+    if no archive contains it.
+    """
+    return _archives.find(eid)
+
+
+def contains(eid):
+    """Returns true if the game identified by eid is in an archive."""
+    return find(eid) is not None
+
+
+def read(eid):
+    """
+    Returns the decompressed JSON data of the game identified by eid from
+    an archive, or None if no archive contains it.
+    """
+    archive = find(eid)
+    if archive is None:
+        return None
+    return archive.read(eid)
+
+
+def reset():
+    """
+    Forgets every archive that has been opened, so that archives built
+    or removed since are picked up on the next read.
+    """
+    _archives.reset()
+
+
+def build(fpath, eids, json_dir=None):
+    """
+    Writes a new archive to fpath containing the games identified by
+    eids. The data for each game is read from the gzipped JSON files in
+    json_dir, which defaults to the directory that comes with nflgame.
+    """
+    if json_dir is None:
+        json_dir = nflgame.datafile.data_dir
+    index = {}
+    with nflgame.datafile.atomic_write(fpath) as out:
+        out.write(_MAGIC)
+        for eid in sorted(eids):
+            with open(path.join(json_dir, '%s.json.gz' % eid), 'rb') as f:
+                blob = f.read()
+            index[eid] = [out.tell(), len(blob)]
+            out.write(blob)
+        start = out.tell()
+        out.write(json.dumps(index, sort_keys=True, separators=(',', ':')))
+        out.write(_TRAILER.pack(start))
+        out.write(_MAGIC)
+    return len(index)
+
+
+def json_eids(json_dir=None):
+    """
+    Returns a sorted list of game identifiers that have a gzipped JSON
+    file in json_dir, which defaults to the directory that comes with
+    nflgame.
+    """
+    if json_dir is None:
+        json_dir = nflgame.datafile.data_dir
+    suffix = '.json.gz'
+    return sorted(f[:-len(suffix)]
+                  for f in os.listdir(json_dir) if f.endswith(suffix))
+
+
+def known_eids():
+    """
+    Returns a sorted list of game identifiers whose JSON data is on disk,
+    either in a gzipped JSON file or in an archive.
+    """
+    eids = set(json_eids())
+    data_dir = nflgame.datafile.data_dir
+    for f in os.listdir(data_dir):
+        if f.endswith('.pack'):
+            archive = _archives.open(path.join(data_dir, f))
+            if archive is not None:
+                eids.update(archive.index)
+    return sorted(eids)
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Packs nflgame\'s directory of gzipped GameCenter JSON '
+                    'files into archives that can be read with far fewer '
+                    'file system operations.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    aa = parser.add_argument
+    aa('--json-dir', type=str, default=nflgame.datafile.data_dir,
+       help='The directory containing the gzipped JSON files to pack.')
+    aa('--output-dir', type=str, default=None,
+       help='The directory to write archives to. Archives are only read '
+            'from the directory that comes with nflgame, so this defaults '
+            'to the JSON directory.')
+    aa('--per-season', action='store_true',
+       help='When set, one archive is written for each season instead of '
+            'a single archive containing every game.')
+    args = parser.parse_args()
+
+    if args.output_dir is None:
+        args.output_dir = args.json_dir
+    nflgame.datafile.require_writable(args.output_dir, 'an archive')
+
+    eids = json_eids(args.json_dir)
+    if args.per_season:
+        groups = [(archive_path(s, args.output_dir), group)
+                  for s, group in nflgame.datafile.by_season(eids)]
+    else:
+        groups = [(archive_path(None, args.output_dir), eids)]
+
+    for fpath, group in groups:
+        n = build(fpath, group, args.json_dir)
+        print('Wrote %d games to %s' % (n, fpath))
+    reset()
+
+if __name__ == '__main__':
+    run()
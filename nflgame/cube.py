@@ -0,0 +1,438 @@
+"""
+The cube module keeps running totals of the game statistics of every
+player, so that totals over any range of weeks in a season can be looked
+up without reading a single game.
+
+A cube has one entry for every player, (season, week) and statistical
+field. Along the week axis, each entry holds the sum of the player's
+statistics from the start of the season up to and including that week.
+The total over a range of weeks is therefore the difference of two
+entries, no matter how many weeks or games the range covers::
+
+    import nflgame.cube
+
+    cube = nflgame.cube.load()
+    cube.total('00-0019596', 'passing_yds', 2012, 5, 8)
+    for p in cube.last_weeks(2012, 17, 4).passing().sort('passing_yds'):
+        print p, p.passing_yds
+
+The player statistics returned have the same players, fields and values
+as `nflgame.combine_game_stats` gives for the same games, though not
+always in the same order.
+
+Most players only have statistics in a handful of fields, so the entries
+of each field are only kept for the players that have a value in that
+field. Each field of each season is an array with a row of weeks for
+every such player.
+
+A cube is built from the GameCenter JSON data of every finished game on
+disk, and is saved next to it as `stats.cube` by the `nflgame-build-cube`
+script. `Cube.refresh` adds games that have been cached to disk since,
+and `Cube.watch` adds each finished game as soon as nflgame caches it.
+
+Saved cubes are encoded with Python's marshal module, like the stores in
+`nflgame.store`. A cube saved by a different version of Python can't be
+loaded and must be rebuilt.
+"""
+from __future__ import absolute_import, division, print_function
+import argparse
+import array
+import bisect
+import marshal
+import os.path as path
+import sys
+import threading
+
+from nflgame import OrderedDict
+import nflgame.datafile
+import nflgame.game
+import nflgame.player
+import nflgame.sched
+import nflgame.seq
+import nflgame.statmap
+
+_MAGIC = 'NFLGCUB2'
+"""The magic string at the start of every saved cube."""
+
+_VERSION = (tuple(sys.version_info[:2]), marshal.version)
+"""Identifies the encoding of marshaled data written by this process."""
+
+max_week = 22
+"""
+The largest week number that a cube has room for. Weeks are numbered from
+zero, which is the first week of some preseasons.
+"""
+
+_SLOTS = max_week + 2
+"""
+The number of entries in a row of weeks. The first entry is always zero,
+so that the total up to week w is `row[w + 1] - row[0]`.
+"""
+
+_GAMES = 'games'
+"""The field counting the games each player played in."""
+
+_HOME = 'home_games'
+"""The field counting the games each player played at home."""
+
+_CATEGORY = 'category:%s'
+"""
+The name of the field counting the games in which each player has
+statistics in a category. A player only gets the fields of a category
+over a range of weeks if the category has a count in that range, just
+like `nflgame.combine_game_stats` only gives a player the fields of the
+games it combines.
+"""
+
+
+def _category(field):
+    """Returns the statistical category that field belongs to."""
+    return field.split('_', 1)[0]
+
+
+def cube_path(cube_dir=None):
+    """
+    Returns the path of the saved cube in cube_dir, which defaults to the
+    directory of GameCenter JSON data that comes with nflgame.
+    """
+    if cube_dir is None:
+        cube_dir = nflgame.datafile.data_dir
+    return path.join(cube_dir, 'stats.cube')
+
+
+class _Field (object):
+    """
+    _Field holds the running totals of one statistical field in one part
+    of a season. rows maps each player id to the position of that
+    player's row of weeks in sums.
+    """
+    __slots__ = ('rows', 'sums')
+
+    def __init__(self, rows=None, sums=None):
+        self.rows = {} if rows is None else rows
+        self.sums = array.array('d') if sums is None else sums
+
+    def add(self, playerid, week, v):
+        """Adds v to the totals of playerid from week on."""
+        r = self.rows.get(playerid)
+        if r is None:
+            r = self.rows[playerid] = len(self.rows)
+            self.sums.extend(array.array('d', [0.0]) * _SLOTS)
+        sums, end = self.sums, (r + 1) * _SLOTS
+        for i in xrange(r * _SLOTS + week + 1, end):
+            sums[i] += v
+
+    def total(self, playerid, start, end):
+        """
+        Returns the total of playerid from week start through week end,
+        or None if playerid has no value in this field.
+        """
+        r = self.rows.get(playerid)
+        if r is None:
+            return None
+        base = r * _SLOTS
+        return self.sums[base + end + 1] - self.sums[base + start]
+
+
+class _Season (object):
+    """
+    _Season holds the running totals of every player in one part of a
+    season, such as the 2012 regular season. players maps each player id
+    to a sorted list of `(week, name, team)` triples, one for each game
+    the player played in, since players can change teams during a season.
+    """
+    def __init__(self):
+        self.players = OrderedDict()
+        self.fields = OrderedDict()
+
+    def field(self, name):
+        if name not in self.fields:
+            self.fields[name] = _Field()
+        return self.fields[name]
+
+
+class Cube (object):
+    """
+    Cube provides running totals of the game statistics of players by
+    season and week. eids is the set of identifiers of the games in the
+    cube.
+
+    A cube may be updated from other threads (see `Cube.watch`), so
+    updates and lookups are serialized with a lock.
+    """
+    def __init__(self):
+        self.eids = set()
+        self._seasons = {}
+        self._lock = threading.Lock()
+
+    def add(self, game):
+        """
+        Adds the statistics of every player in game to the cube. Games
+        that aren't over, that aren't in the schedule or that are already
+        in the cube are ignored. Returns true if the game was added.
+        """
+        info = game.schedule
+        if info is None or not game.game_over():
+            return False
+        if not 0 <= info['week'] <= max_week:
+            raise ValueError('Week %d of game "%s" is beyond the last week '
+                             'of a cube.' % (info['week'], game.eid))
+        with self._lock:
+            if game.eid in self.eids:
+                return False
+            key = (info['year'], info['season_type'])
+            season = self._seasons.setdefault(key, _Season())
+            week = info['week']
+            for p in game.players:
+                pid = p.playerid
+                bisect.insort(season.players.setdefault(pid, []),
+                              (week, p.name, p.team))
+                season.field(_GAMES).add(pid, week, 1)
+                if p.home:
+                    season.field(_HOME).add(pid, week, 1)
+                cats = set()
+                for name, v in p._items():
+                    season.field(name).add(pid, week, v)
+                    cats.add(_category(name))
+                for cat in cats:
+                    season.field(_CATEGORY % cat).add(pid, week, 1)
+            self.eids.add(game.eid)
+        return True
+
+    def refresh(self):
+        """
+        Adds every finished game in the schedule whose JSON data is on
+        disk and that isn't in the cube yet. Returns the number of games
+        added.
+
+        Only games missing from the cube are read, so refreshing a cube
+        that is up to date is cheap.
+        """
+        n = 0
+        for eid in nflgame.sched.games.keys():
+            if eid in self.eids or not nflgame.game._is_cached(eid):
+                continue
+            g = nflgame.game.Game(eid)
+            if g is not None and self.add(g):
+                n += 1
+        return n
+
+    def watch(self):
+        """
+        Adds each finished game to the cube as soon as nflgame caches its
+        JSON data to disk, which happens the first time a finished game
+        is downloaded. The cube isn't saved automatically.
+        """
+        if self.add not in nflgame.game.on_save:
+            nflgame.game.on_save.append(self.add)
+
+    def unwatch(self):
+        """Stops adding games to the cube as they are cached."""
+        while self.add in nflgame.game.on_save:
+            nflgame.game.on_save.remove(self.add)
+
+    def total(self, playerid, field, season, start=None, end=None,
+              kind='REG'):
+        """
+        Returns the total of the statistical field for the player with id
+        playerid from week start through week end of season. start and end
+        default to the first and last weeks of the season. The kind
+        parameter has the same meaning as in `nflgame.games`.
+
+        This costs the same for any range of weeks.
+        """
+        start, end = _weeks(start, end)
+        with self._lock:
+            s = self._seasons.get((season, kind))
+            if s is None or field not in s.fields:
+                return 0
+            return _number(s.fields[field].total(playerid, start, end) or 0)
+
+    def players(self, season, start=None, end=None, kind='REG'):
+        """
+        Returns a `nflgame.seq.GenPlayerStats` of the total statistics
+        of every player who played in a game from week start through week
+        end of season. start and end default to the first and last weeks
+        of the season. The kind parameter has the same meaning as in
+        `nflgame.games`.
+
+        The result has the same players and values as::
+
+            nflgame.combine_game_stats(nflgame.games(season,
+                                                     week=range(start,
+                                                                end + 1),
+                                                     kind=kind))
+
+        except that no games are read. Players are in the order they
+        first played in the season, so they may be in a different order
+        when start isn't the first week of the season.
+        """
+        start, end = _weeks(start, end)
+        with self._lock:
+            s = self._seasons.get((season, kind))
+            if s is None:
+                return nflgame.seq.GenPlayerStats(OrderedDict())
+            games = s.fields[_GAMES]
+            home = s.fields.get(_HOME, _Field())
+            players = OrderedDict()
+            for pid, weeks in s.players.iteritems():
+                n = _number(games.total(pid, start, end))
+                if n == 0:
+                    continue
+                i = bisect.bisect_left(weeks, (start,))
+                _, name, team = weeks[i]
+                h = home.total(pid, start, end) or 0
+                if h == n:
+                    is_home = True
+                elif h == 0:
+                    is_home = False
+                else:
+                    is_home = None
+                p = nflgame.player.GamePlayerStats(pid, name, is_home, team)
+                p.games = n
+                players[pid] = p
+            for name, f in s.fields.iteritems():
+                # The counts aren't statistics. The category counts are
+                # skipped because there is no count of their category.
+                cat = s.fields.get(_CATEGORY % _category(name))
+                if name in (_GAMES, _HOME) or cat is None:
+                    continue
+                fid = nflgame.statmap.field_id(name)
+                for pid in f.rows:
+                    if pid in players and cat.total(pid, start, end) > 0:
+                        players[pid]._put(fid, _number(f.total(pid, start,
+                                                               end)))
+        return nflgame.seq.GenPlayerStats(players)
+
+    def season_to_date(self, season, week, kind='REG'):
+        """
+        Returns the total statistics of every player from the start of
+        season through week, as in `nflgame.cube.Cube.players`.
+        """
+        return self.players(season, None, week, kind)
+
+    def last_weeks(self, season, week, n, kind='REG'):
+        """
+        Returns the total statistics of every player over the n weeks of
+        season ending with week, as in `nflgame.cube.Cube.players`.
+        """
+        return self.players(season, max(0, week - n + 1), week, kind)
+
+    def save(self, fpath=None):
+        """
+        Saves the cube to fpath, which defaults to `stats.cube` in the
+        directory of GameCenter JSON data that comes with nflgame.
+        """
+        if fpath is None:
+            fpath = cube_path()
+        with self._lock:
+            seasons = {}
+            for key, s in self._seasons.iteritems():
+                fields = [(name, f.rows, f.sums.tostring())
+                          for name, f in s.fields.iteritems()]
+                seasons[key] = (s.players.items(), fields)
+            data = {
+                'byteorder': sys.byteorder,
+                'eids': sorted(self.eids),
+                'seasons': seasons,
+            }
+            with nflgame.datafile.atomic_write(fpath) as out:
+                out.write(_MAGIC)
+                out.write(marshal.dumps(_VERSION))
+                out.write(marshal.dumps(data))
+
+
+def _weeks(start, end):
+    if start is None:
+        start = 0
+    if end is None:
+        end = max_week
+    if not 0 <= start <= end <= max_week:
+        raise ValueError('Week range %d through %d is not valid.'
+                         % (start, end))
+    return start, end
+
+
+def _number(v):
+    """Returns v as an int if it is a whole number."""
+    if v is not None and v == int(v):
+        return int(v)
+    return v
+
+
+def load(fpath=None):
+    """
+    Returns the cube saved at fpath, which defaults to `stats.cube` in the
+    directory of GameCenter JSON data that comes with nflgame. An IOError
+    is raised if there is no cube at fpath, and a ValueError is raised if
+    it was saved by a different version of Python.
+    """
+    if fpath is None:
+        fpath = cube_path()
+    with open(fpath, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise IOError('"%s" is not an nflgame cube.' % fpath)
+        try:
+            if marshal.load(f) != _VERSION:
+                raise ValueError
+            data = marshal.load(f)
+        except (EOFError, ValueError, TypeError):
+            raise ValueError('"%s" was saved by a different version of '
+                             'Python.' % fpath)
+
+    cube = Cube()
+    cube.eids = set(data['eids'])
+    for key, (players, fields) in data['seasons'].iteritems():
+        s = cube._seasons[key] = _Season()
+        s.players.update(players)
+        for name, rows, blob in fields:
+            sums = array.array('d')
+            sums.fromstring(blob)
+            if data['byteorder'] != sys.byteorder:
+                sums.byteswap()
+            s.fields[name] = _Field(rows, sums)
+    return cube
+
+
+def build():
+    """
+    Returns a new cube of every finished game in the schedule whose JSON
+    data is on disk.
+    """
+    cube = Cube()
+    cube.refresh()
+    return cube
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Builds a cube of running totals of player statistics '
+                    'by season and week from nflgame\'s GameCenter JSON '
+                    'data, or adds new games to an existing cube.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    aa = parser.add_argument
+    aa('--output', type=str, default=cube_path(),
+       help='The file to write the cube to. By default, the cube that '
+            'is loaded by nflgame.cube.load is written.')
+    aa('--rebuild', action='store_true',
+       help='When set, the cube is built from scratch instead of adding '
+            'new games to the cube at the output file.')
+    args = parser.parse_args()
+
+    nflgame.datafile.require_writable(path.dirname(path.abspath(args.output)),
+                                      'a cube')
+
+    cube = None
+    if not args.rebuild:
+        try:
+            cube = load(args.output)
+        except (IOError, ValueError):
+            pass
+    if cube is None:
+        cube = Cube()
+    n = cube.refresh()
+    cube.save(args.output)
+    print('Added %d games to %s' % (n, args.output))
+
+if __name__ == '__main__':
+    run()
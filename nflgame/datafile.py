@@ -0,0 +1,162 @@
+"""
+The datafile module holds what is common to the files that nflgame builds
+from its GameCenter JSON data: archives (`nflgame.archive`), stores
+(`nflgame.store`), play tables (`nflgame.playtable`) and cubes
+(`nflgame.cube`), as well as the schedule.
+
+Every one of these files is written with `nflgame.datafile.atomic_write`,
+which writes to a temporary file first and then moves it into place.
+Moving a file is atomic, so a process reading one of these files sees
+either the old file or the new one, but never a partially written file.
+"""
+from __future__ import absolute_import, division, print_function
+import contextlib
+import os
+import os.path as path
+import sys
+import tempfile
+import threading
+
+data_dir = path.join(path.split(__file__)[0], 'gamecenter-json')
+"""
+The directory of GameCenter JSON data that comes with nflgame. Files built
+from the JSON data are only read from this directory.
+"""
+
+
+def season_of(eid):
+    """
+    Returns the season that the game identified by eid belongs to.
+    Games played in January through March belong to the previous season.
+    """
+    year, month = int(eid[0:4]), int(eid[4:6])
+    if month <= 3:
+        year -= 1
+    return year
+
+
+def by_season(eids):
+    """
+    Returns a list of pairs `(season, eids)` that groups the game
+    identifiers in eids by season, sorted by season.
+    """
+    seasons = {}
+    for eid in eids:
+        seasons.setdefault(season_of(eid), []).append(eid)
+    return sorted(seasons.iteritems())
+
+
+class SeasonFiles (object):
+    """
+    SeasonFiles finds and opens the files of one kind (e.g., archives)
+    that contain the data of games. There may be one file per season
+    (e.g., `2012.pack`) or one file for every game (`all.pack`). The
+    season file is tried before the file for every game.
+
+    Files are opened by calling opener with their path. If opener raises
+    one of the exceptions in the tuple errors, then there is no usable
+    file at that path. Either way, the result is remembered, so each file
+    is opened at most once per process.
+    """
+    def __init__(self, ext, opener, errors):
+        self.ext = ext
+        self._opener = opener
+        self._errors = errors
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def path(self, season=None, dirpath=None):
+        """
+        Returns the path of the file for season in dirpath, which defaults
+        to `nflgame.datafile.data_dir`. If season is None, then the path
+        of the file for every game is returned.
+        """
+        if dirpath is None:
+            dirpath = data_dir
+        name = 'all' if season is None else str(season)
+        return path.join(dirpath, '%s.%s' % (name, self.ext))
+
+    def open(self, fpath):
+        """
+        Returns the opened file at fpath, or None if there is no usable
+        file at that location.
+        """
+        with self._lock:
+            if fpath not in self._files:
+                try:
+                    self._files[fpath] = self._opener(fpath)
+                except self._errors:
+                    self._files[fpath] = None
+            return self._files[fpath]
+
+    def find(self, eid):
+        """
+        Returns the opened file containing the game identified by eid, or
+        None if no file contains it.
+        """
+        for fpath in (self.path(season_of(eid)), self.path()):
+            f = self.open(fpath)
+            if f is not None and eid in f:
+                return f
+        return None
+
+    def reset(self):
+        """
+        Forgets every file that has been opened, so that files built or
+        removed since are picked up the next time one is needed.
+        """
+        with self._lock:
+            self._files.clear()
+
+
+@contextlib.contextmanager
+def atomic_write(fpath, mode='wb'):
+    """
+    Returns a context manager that opens a temporary file for writing
+    with mode and moves it to fpath once the with block is done::
+
+        with nflgame.datafile.atomic_write(fpath) as out:
+            out.write(data)
+
+    Every writer gets a temporary file of its own in the directory of
+    fpath, so processes writing the same file at the same time can't mix
+    up their data. The last one to finish wins.
+
+    If the with block raises an exception, then the temporary file is
+    removed and the file at fpath is left untouched.
+
+    The new file keeps the permissions of the file it replaces, or is
+    readable by everyone if there was none.
+    """
+    dirpath, name = path.split(path.abspath(fpath))
+    fd, tmp = tempfile.mkstemp(prefix='.%s.' % name, suffix='.tmp',
+                               dir=dirpath)
+    try:
+        with os.fdopen(fd, mode) as out:
+            try:
+                perms = os.stat(fpath).st_mode & 0o777
+            except OSError:
+                perms = 0o644
+            os.chmod(tmp, perms)
+            yield out
+        os.rename(tmp, fpath)
+    except:
+        os.remove(tmp)
+        raise
+
+
+def eprint(*args, **kwargs):
+    kwargs['file'] = sys.stderr
+    print(*args, **kwargs)
+
+
+def require_writable(dirpath, what):
+    """
+    Exits with an error message if this process can't write to the
+    directory dirpath. what describes the file that was going to be
+    written, e.g., "an archive".
+    """
+    if not os.access(dirpath, os.W_OK):
+        eprint('I do not have write access to "%s".' % dirpath)
+        eprint('Without write access, I cannot write %s.' % what)
+        sys.exit(1)
@@ -0,0 +1,80 @@
+"""
+The decoder module chooses the JSON decoder used to read GameCenter
+JSON data, the schedule and the player database.
+
+Decoding JSON is the most expensive part of loading games, so nflgame uses
+an accelerated decoder when one is installed. The candidates are tried in
+the order given by `nflgame.decoder.backends`, and the standard library's
+json module is always available as a last resort. The choice can be
+overridden with the `NFLGAME_JSON` environment variable or by calling
+`nflgame.decoder.use`.
+
+Note that decoders differ slightly in the types they return. For example,
+simplejson returns `str` instead of `unicode` for strings that are plain
+ASCII. These values compare equal, so nflgame doesn't care.
+"""
+import os
+
+backends = ('ujson', 'simplejson', 'json')
+"""The names of the supported decoders, in order of preference."""
+
+backend = None
+"""The name of the decoder currently in use."""
+
+loads = None
+"""
+Decodes a string of JSON data with the decoder currently in use.
+This is rebound whenever a decoder is chosen.
+"""
+
+
+def _load(name):
+    """
+    Returns the loads function of the decoder called name. An ImportError
+    is raised if it isn't installed (or, in the case of simplejson, if it
+    was installed without its C extension, which makes it slower than the
+    standard library).
+    """
+    if name not in backends:
+        raise ImportError('Unknown JSON decoder "%s".' % name)
+    if name == 'simplejson':
+        import simplejson
+        import simplejson._speedups
+        return simplejson.loads
+    return __import__(name).loads
+
+
+def use(name=None):
+    """
+    Switches to the decoder called name, which must be one of the names
+    in `nflgame.decoder.backends`. An ImportError is raised if that decoder
+    is not usable.
+
+    If name is None, then the first usable decoder in
+    `nflgame.decoder.backends` is chosen.
+    """
+    global backend, loads
+
+    if name is not None:
+        loads, backend = _load(name), name
+        return
+    for name in backends:
+        try:
+            loads, backend = _load(name), name
+            return
+        except ImportError:
+            pass
+
+
+def available():
+    """Returns the names of the decoders that are usable."""
+    names = []
+    for name in backends:
+        try:
+            _load(name)
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+use(os.getenv('NFLGAME_JSON') or None)
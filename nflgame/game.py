@@ -1,23 +1,35 @@
 from collections import namedtuple
+import collections
+import multiprocessing
 import os
 import os.path as path
 import gzip
-import json
+import Queue
 import socket
 import sys
+import threading
 import urllib2
 
 from nflgame import OrderedDict
+import nflgame.archive
+import nflgame.datafile
+import nflgame.decoder
 import nflgame.player
 import nflgame.sched
 import nflgame.seq
 import nflgame.statmap
-
-_MAX_INT = sys.maxint
+import nflgame.store
 
 _jsonf = path.join(path.split(__file__)[0], 'gamecenter-json', '%s.json.gz')
 _json_base_url = "http://www.nfl.com/liveupdate/game-center/%s/%s_gtd.json"
 
+on_save = []
+"""
+A list of functions that are called with each finished game right after
+its JSON data has been cached to disk by `nflgame.game.Game`. This is how
+`nflgame.cube.Cube.watch` keeps a cube up to date.
+"""
+
 GameDiff = namedtuple('GameDiff', ['before', 'after', 'plays', 'players'])
 """
 Represents the difference between two points in time of the same game
@@ -220,6 +232,21 @@ class Game (object):
     """
 
     def __new__(cls, eid=None, fpath=None):
+        # Games in a store are already parsed. Their raw JSON data is only
+        # loaded if it's asked for.
+        if eid is not None and fpath is None:
+            game = cache.get(eid)
+            if game is not None:
+                return game
+
+            store = nflgame.store.find(eid)
+            if store is not None:
+                game = object.__new__(cls)
+                game.eid = eid
+                game.data = store.load(eid)[eid]
+                game._size = store.size(eid)
+                return game
+
         # If we can't get a valid JSON data, exit out and return None.
         try:
             rawData = _get_json_data(eid, fpath)
@@ -229,14 +256,15 @@ class Game (object):
             return None
         game = object.__new__(cls)
         game.rawData = rawData
+        game._size = len(rawData)
 
         try:
             if eid is not None:
                 game.eid = eid
-                game.data = json.loads(game.rawData)[game.eid]
+                game.data = nflgame.decoder.loads(game.rawData)[game.eid]
             else:  # For when we have rawData (fpath) and no eid.
                 game.eid = None
-                game.data = json.loads(game.rawData)
+                game.data = nflgame.decoder.loads(game.rawData)
                 for k, v in game.data.iteritems():
                     if isinstance(v, dict):
                         game.eid = k
@@ -261,7 +289,15 @@ class Game (object):
         read it from disk.
 
         When the JSON data is written to disk, it is compressed using gzip.
+
+        Games that are over are also kept in `nflgame.game.cache`, so
+        creating the same game again returns the same object without
+        reading or parsing any data.
         """
+        # A game that came out of the cache is already initialized.
+        if self in cache:
+            return
+
         # Make the schedule info more accessible.
         self.schedule = nflgame.sched.games.get(self.eid, None)
 
@@ -305,8 +341,12 @@ class Game (object):
             self.scores.append(s)
 
         # Check to see if the game is over, and if so, cache the data.
-        if self.game_over() and not os.access(_jsonf % eid, os.R_OK):
+        if self.game_over() and not _is_cached(self.eid):
             self.save()
+            for f in on_save:
+                f(self)
+        if self.game_over() and self.eid is not None:
+            cache.put(self)
 
     def is_home(self, team):
         """Returns true if team (i.e., 'NE') is the home team."""
@@ -314,11 +354,7 @@ class Game (object):
 
     def season(self):
         """Returns the year of the season this game belongs to."""
-        year = int(self.eid[0:4])
-        month = int(self.eid[4:6])
-        if month <= 3:
-            year -= 1
-        return year
+        return nflgame.datafile.season_of(self.eid)
 
     def game_over(self):
         """game_over returns true if the game is no longer being played."""
@@ -363,42 +399,53 @@ class Game (object):
         Taking the max values of each statistic reduces the chance of being
         wrong (particularly for stats that are in both play-by-play data
         and game statistics), but does not eliminate them.
+
+        A game's data never changes once it has been loaded, so the result
+        is remembered and the players returned must not be modified. (This
+        lets `nflgame.game.diff` reuse the statistics computed for the
+        previous snapshot of a game when it is the `before` game.)
         """
-        game_players = list(self.players)
-        play_players = list(self.drives.plays().players())
+        max_players = self.__dict__.get('_max_players')
+        if max_players is not None:
+            return nflgame.seq.GenPlayerStats(max_players)
+
+        self.players  # Make sure the game level statistics are loaded.
+        game_players = self.__players
+        play_players = self.drives.plays().players()
         max_players = OrderedDict()
 
         # So this is a little tricky. It's possible for a player to have
         # only statistics at the play level, and therefore not be represented
         # in the game level statistics. Therefore, we initialize our
-        # max_players with play-by-play stats first. Then go back through
-        # and combine them with available game statistics.
+        # max_players with play-by-play stats first. Then we merge in the
+        # game statistics of each player, which are looked up by player id.
         for pplay in play_players:
             newp = nflgame.player.GamePlayerStats(pplay.playerid,
                                                   pplay.name, pplay.home,
                                                   pplay.team)
-            maxstats = {}
-            for stat, val in pplay._stats.iteritems():
-                maxstats[stat] = val
-
-            newp._overwrite_stats(maxstats)
+            newp._ids.extend(pplay._ids)
+            newp._vals.extend(pplay._vals)
             max_players[pplay.playerid] = newp
 
-        for newp in max_players.itervalues():
-            for pgame in game_players:
-                if pgame.playerid != newp.playerid:
-                    continue
-
-                maxstats = {}
-                for stat, val in pgame._stats.iteritems():
-                    maxstats[stat] = max([val,
-                                          newp._stats.get(stat, -_MAX_INT)])
+            pgame = game_players.get(pplay.playerid)
+            if pgame is None:
+                continue
+            positions = dict((fid, i) for i, fid in enumerate(newp._ids))
+            for fid, val in zip(pgame._ids, pgame._vals):
+                i = positions.get(fid)
+                if i is None:
+                    newp._ids.append(fid)
+                    newp._vals.append(val)
+                else:
+                    newp._vals[i] = max(val, newp._vals[i])
 
-                newp._overwrite_stats(maxstats)
-                break
+        self._max_players = max_players
         return nflgame.seq.GenPlayerStats(max_players)
 
     def __getattr__(self, name):
+        if name == 'rawData':
+            self.rawData = _get_json_data(self.eid)
+            return self.rawData
         if name == 'players':
             self.__players = _json_game_player_stats(self, self.data)
             self.players = nflgame.seq.GenPlayerStats(self.__players)
@@ -416,6 +463,113 @@ class Game (object):
         return self.nice_score()
 
 
+_unchanged = object()
+"""The default of `nflgame.game.GameCache.configure` for bounds not given."""
+
+
+class GameCache (object):
+    """
+    GameCache is a bounded cache of games that are over, keyed by game
+    identifier. When the cache is full, the least recently used game is
+    evicted.
+
+    The cache can be bounded by the number of games it holds and by the
+    total size of those games. The size of a game is approximated by the
+    size of its JSON data (or its size in a store), which is a small
+    fraction of the memory used by the parsed game. A bound of None means
+    that there is no bound.
+
+    The number of lookups that found a game and the number that didn't are
+    counted in the `hits` and `misses` attributes.
+
+    Note that games in the cache are shared. If you modify a Game object
+    returned by `nflgame.games` or `nflgame.one`, then every later lookup of
+    the same game will see those modifications.
+    """
+    def __init__(self, max_games=32, max_bytes=None):
+        self.max_games = max_games
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._games = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, eid):
+        """
+        Returns the game identified by eid, or None if it isn't cached.
+        A game that is found becomes the most recently used game.
+        """
+        with self._lock:
+            game = self._games.pop(eid, None)
+            if game is None:
+                self.misses += 1
+                return None
+            self._games[eid] = game
+            self.hits += 1
+            return game
+
+    def put(self, game):
+        """
+        Adds game to the cache as the most recently used game, evicting
+        other games if the cache is full. Games that haven't finished are
+        never cached.
+        """
+        if not game.game_over():
+            return
+        with self._lock:
+            old = self._games.pop(game.eid, None)
+            if old is not None:
+                self.nbytes -= old._size
+            self._games[game.eid] = game
+            self.nbytes += game._size
+            self._evict()
+
+    def configure(self, max_games=_unchanged, max_bytes=_unchanged):
+        """
+        Sets the bounds of the cache, evicting games if it is now too
+        full. Bounds that aren't given keep their current value, and a
+        bound of None removes it. Setting max_games to 0 disables the
+        cache.
+        """
+        with self._lock:
+            if max_games is not _unchanged:
+                self.max_games = max_games
+            if max_bytes is not _unchanged:
+                self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """Removes every game from the cache and resets the counters."""
+        with self._lock:
+            self._games.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def _full(self):
+        if self.max_games is not None and len(self._games) > self.max_games:
+            return True
+        return self.max_bytes is not None and self.nbytes > self.max_bytes
+
+    def _evict(self):
+        while len(self._games) > 0 and self._full():
+            _, game = self._games.popitem(last=False)
+            self.nbytes -= game._size
+
+    def __contains__(self, game):
+        return self._games.get(getattr(game, 'eid', None)) is game
+
+    def __len__(self):
+        return len(self._games)
+
+cache = GameCache()
+"""
+The cache of finished games used by `nflgame.game.Game`. Its bounds can
+be changed with `nflgame.game.GameCache.configure`.
+"""
+
+
 def diff(before, after):
     """
     Returns the difference between two points of time in a game in terms of
@@ -428,12 +582,10 @@ def diff(before, after):
     """
     assert after.eid == before.eid
 
-    plays = []
-    after_plays = list(after.drives.plays())
-    before_plays = list(before.drives.plays())
-    for play in after_plays:
-        if play not in before_plays:
-            plays.append(play)
+    # Plays are equal when their ids and descriptions are equal.
+    before_plays = set((p.playid, p.desc) for p in before.drives.plays())
+    plays = [p for p in after.drives.plays()
+             if (p.playid, p.desc) not in before_plays]
 
     # You might think that updated play data is enough. You could scan
     # it for statistics you're looking for (like touchdowns).
@@ -441,18 +593,15 @@ def diff(before, after):
     # updated (late call? play review? etc.)
     # Thus, we do a diff on the play statistics for player data too.
     _players = OrderedDict()
-    after_players = list(after.max_player_stats())
-    before_players = list(before.max_player_stats())
-    for aplayer in after_players:
-        has_before = False
-        for bplayer in before_players:
-            if aplayer.playerid == bplayer.playerid:
-                has_before = True
-                pdiff = aplayer - bplayer
-                if pdiff is not None:
-                    _players[aplayer.playerid] = pdiff
-        if not has_before:
+    before_players = dict((p.playerid, p) for p in before.max_player_stats())
+    for aplayer in after.max_player_stats():
+        bplayer = before_players.get(aplayer.playerid)
+        if bplayer is None:
             _players[aplayer.playerid] = aplayer
+            continue
+        pdiff = aplayer - bplayer
+        if pdiff is not None:
+            _players[aplayer.playerid] = pdiff
     players = nflgame.seq.GenPlayerStats(_players)
 
     return GameDiff(before=before, after=after, plays=plays, players=players)
@@ -466,10 +615,17 @@ class Drive (object):
     and stop times and field position, length of possession, the number
     of first downs and a short descriptive string of the result of the
     drive.
+
+    The meta information is read when the drive is created, but the plays
+    are only built the first time the `plays` attribute is accessed. So
+    searching drives by their meta information (e.g., with
+    `drives.filter(result='Touchdown')`) doesn't pay for building the
+    plays of every drive.
     """
     def __init__(self, game, drive_num, home_team, data):
         if data is None or 'plays' not in data or len(data['plays']) == 0:
             return
+        self.__data = data
         self.game = game
         self.drive_num = drive_num
         self.team = data['posteam']
@@ -517,9 +673,6 @@ class Drive (object):
                 and self.time_end.quarter in (1, 3):
             self.time_end.quarter += 1
 
-        self.__plays = _json_plays(self, data['plays'])
-        self.plays = nflgame.seq.GenPlays(self.__plays)
-
     def __add__(self, other):
         """
         Adds the statistics of two drives together.
@@ -540,6 +693,7 @@ class Drive (object):
         new_drive.pos_time = self.pos_time + other.pos_time
         new_drive.play_cnt = self.play_cnt + other.play_cnt
         new_drive.__plays = self.__plays + other.__plays
+        new_drive.plays = nflgame.seq.GenPlays(new_drive.__plays)
         new_drive.result = None
         new_drive.field_start = None
         new_drive.field_end = None
@@ -547,6 +701,22 @@ class Drive (object):
         new_drive.time_end = None
         return new_drive
 
+    def players(self):
+        """
+        Returns the combined player stats for every player that participated
+        in any of the plays in this drive.
+        """
+        return self.plays.players()
+
+    def __getattr__(self, name):
+        if name in ('plays', '_Drive__plays'):
+            data = self.__dict__.get('_Drive__data')
+            if data is not None:
+                self.__plays = _json_plays(self, data['plays'])
+                self.plays = nflgame.seq.GenPlays(self.__plays)
+                return self.__dict__[name]
+        raise AttributeError
+
     def __str__(self):
         return '%s (Start: %s, End: %s) %s' \
                % (self.team, self.time_start, self.time_end, self.result)
@@ -583,28 +753,21 @@ class Play (object):
 
         # Load team statistics directly into the Play instance.
         # Things like third down attempts, first downs, etc.
-        if '0' in data['players']:
-            for info in data['players']['0']:
-                if info['statId'] not in nflgame.statmap.idmap:
-                    continue
-                statvals = nflgame.statmap.values(info['statId'],
-                                                  info['yards'])
-                for k, v in statvals.iteritems():
-                    v = self.__dict__.get(k, 0) + v
-                    self.__dict__[k] = v
-                    self._stats[k] = v
-
-        # Load the sequence of "events" in a play into a list of dictionaries.
-        self.events = _json_play_events(data['players'])
+        # Each stat event is expanded once, and the result is shared by
+        # the team statistics, the player statistics and the events.
+        team, self.__players, self.events = \
+            _json_play_stats(self, data['players'])
+        for k, v in team.iteritems():
+            self.__dict__[k] = v
+            self._stats[k] = v
 
         # Now load cumulative player data for this play into
         # a GenPlayerStats generator. We then flatten this data
         # and add it to the play itself so that plays can be
         # filter by these statistics.
-        self.__players = _json_play_players(self, data['players'])
         self.players = nflgame.seq.GenPlayerStats(self.__players)
         for p in self.players:
-            for k, v in p.stats.iteritems():
+            for k, v in p._items():
                 # Sometimes we may see duplicate statistics (like tackle
                 # assists). Let's just overwrite in this case, since this
                 # data is from the perspective of the play. i.e., there
@@ -699,51 +862,47 @@ def _json_plays(drive, data):
     return plays
 
 
-def _json_play_players(play, data):
+def _json_play_stats(play, data):
     """
-    Takes a single JSON play entry (data) and converts it to an OrderedDict
-    of player statistics.
+    Takes the players of a single JSON play entry (data) and expands each
+    of its stat events exactly once. Returns a triple of a dict of the team
+    statistics of the play, an OrderedDict of player statistics and the
+    list of events in the play.
 
     play is the instance of Play that this data is part of. It is used
     to determine whether the player belong to the home team or not.
     """
-    players = OrderedDict()
+    dispatch, expand = nflgame.statmap.dispatch, nflgame.statmap.expand
+    team, players, temp = {}, OrderedDict(), []
     for playerid, statcats in data.iteritems():
-        if playerid == '0':
-            continue
         for info in statcats:
-            if info['statId'] not in nflgame.statmap.idmap:
+            entry = dispatch.get(info['statId'])
+            if entry is None:
                 continue
-            if playerid not in players:
-                home = play.drive.game.is_home(info['clubcode'])
-                if home:
-                    team_name = play.drive.game.home
-                else:
-                    team_name = play.drive.game.away
-                stats = nflgame.player.PlayPlayerStats(playerid,
-                                                       info['playerName'],
-                                                       home, team_name)
-                players[playerid] = stats
-            statvals = nflgame.statmap.values(info['statId'], info['yards'])
-            players[playerid]._add_stats(statvals)
-    return players
-
-
-def _json_play_events(data):
-    """
-    Takes a single JSON play entry (data) and converts it to a list of events.
-    """
-    temp = list()
-    for playerid, statcats in data.iteritems():
-        for info in statcats:
-            if info['statId'] not in nflgame.statmap.idmap:
-                continue
-            statvals = nflgame.statmap.values(info['statId'], info['yards'])
+            statvals = expand(entry, info['yards'])
+            if playerid == '0':
+                for k, v in statvals.iteritems():
+                    team[k] = team.get(k, 0) + v
+            else:
+                if playerid not in players:
+                    home = play.drive.game.is_home(info['clubcode'])
+                    if home:
+                        team_name = play.drive.game.home
+                    else:
+                        team_name = play.drive.game.away
+                    stats = nflgame.player.PlayPlayerStats(
+                        playerid, info['playerName'], home, team_name)
+                    players[playerid] = stats
+                players[playerid]._add_stats(statvals)
+
+            # The stat values are reused as the event, which is only safe
+            # once they have been added to the team or player above.
             statvals['playerid'] = None if playerid == '0' else playerid
             statvals['playername'] = info['playerName'] or None
             statvals['team'] = info['clubcode']
             temp.append((int(info['sequence']), statvals))
-    return [t[1] for t in sorted(temp, key=lambda t: t[0])]
+    events = [t[1] for t in sorted(temp, key=lambda t: t[0])]
+    return team, players, events
 
 
 def _json_game_player_stats(game, data):
@@ -782,6 +941,9 @@ def _get_json_data(eid=None, fpath=None):
     Returns the JSON data corresponding to the game represented by eid.
 
     If the JSON data is already on disk, it is read, decompressed and returned.
+    Packed archives (see `nflgame.archive`) are searched before the
+    individual gzipped JSON files. (Pre-parsed stores, see `nflgame.store`,
+    are used by `nflgame.game.Game` directly and are not searched here.)
 
     Otherwise, the JSON data is downloaded from the NFL web site. If the data
     doesn't exist yet or there was an error, _get_json_data returns None.
@@ -793,6 +955,10 @@ def _get_json_data(eid=None, fpath=None):
     if fpath is not None:
         return gzip.open(fpath).read()
 
+    data = nflgame.archive.read(eid)
+    if data is not None:
+        return data
+
     fpath = _jsonf % eid
     if os.access(fpath, os.R_OK):
         return gzip.open(fpath).read()
@@ -805,6 +971,191 @@ def _get_json_data(eid=None, fpath=None):
     return None
 
 
+def _load_data(eid):
+    """
+    Reads or downloads the JSON data of the game identified by eid, and
+    returns it as a tuple of eid and the JSON data, which is None if there
+    is no data for the game. This is run in the worker processes of
+    `nflgame.game._load_parallel`.
+
+    The data isn't decoded here, since sending the decoded data back to
+    the parent process would cost more than decoding it there.
+    """
+    try:
+        rawData = _get_json_data(eid)
+    except urllib2.URLError:
+        return eid, None
+    if rawData is None or rawData.strip() == '{}':
+        return eid, None
+    return eid, rawData
+
+
+def _game_from_data(eid, rawData):
+    """
+    Creates a Game from the JSON data returned by
+    `nflgame.game._load_data`, or returns None if there is no valid data.
+    """
+    if rawData is None:
+        return None
+    game = object.__new__(Game)
+    game.eid = eid
+    game.rawData = rawData
+    game._size = len(rawData)
+    try:
+        game.data = nflgame.decoder.loads(rawData)[eid]
+    except (ValueError, KeyError):
+        return None
+    game.__init__(eid)
+    return game
+
+
+def _load_locally(eid):
+    """
+    Returns true if the game identified by eid should be loaded in this
+    process by `nflgame.game._load_parallel` rather than by a worker.
+
+    That's the case for games that are in `nflgame.game.cache` or on
+    disk. Reading a game from disk is cheap next to decoding it, which has
+    to happen in this process either way, so only downloads are worth
+    handing to a worker.
+    """
+    return eid in cache._games or _is_cached(eid)
+
+
+def _load_parallel(eids, workers, ordered=True):
+    """
+    Returns a generator of Game objects for the games identified by eids,
+    where the JSON data of games that aren't on disk yet is downloaded by
+    a pool of worker processes and decoded in this process. Games that
+    don't exist are skipped. The pool is only started if there is a game
+    to download.
+
+    If ordered is True, games are generated in the same order as eids.
+    Otherwise, they are generated as soon as they are loaded.
+
+    At most two games per worker are handed to the pool ahead of the
+    consumer. If the consumer stops early, the pool finishes the games
+    already handed to it and then exits. (Terminating the pool instead
+    can deadlock, since a worker may be killed while it holds the lock on
+    the queue of results.)
+    """
+    local = set(eid for eid in eids if _load_locally(eid))
+    remote = iter([eid for eid in eids if eid not in local])
+    window = 2 * workers
+    pending = collections.deque()
+    pools = []
+
+    def submit():
+        while len(pending) < window:
+            eid = next(remote, None)
+            if eid is None:
+                return
+            if len(pools) == 0:
+                pools.append(multiprocessing.Pool(workers))
+            pending.append(pools[0].apply_async(_load_data, (eid,)))
+
+    try:
+        submit()
+        if ordered:
+            for eid in eids:
+                if eid in local:
+                    g = Game(eid)
+                else:
+                    submit()
+                    g = _game_from_data(*pending.popleft().get())
+                if g is not None:
+                    yield g
+        else:
+            for eid in eids:
+                if eid in local:
+                    g = Game(eid)
+                    if g is not None:
+                        yield g
+            while len(pending) > 0:
+                ready = [r for r in pending if r.ready()]
+                if len(ready) == 0:
+                    pending[0].wait(0.05)
+                    continue
+                for r in ready:
+                    pending.remove(r)
+                submit()
+                for r in ready:
+                    g = _game_from_data(*r.get())
+                    if g is not None:
+                        yield g
+    finally:
+        for pool in pools:
+            pool.close()
+            pool.join()
+
+
+def _load_prefetch(eids, prefetch):
+    """
+    Returns a generator of Game objects for the games identified by eids,
+    in order, where a background thread loads up to prefetch games ahead
+    of the consumer. Games that don't exist are skipped.
+
+    This lets reading and decoding the next game overlap with whatever
+    the consumer does with the current one, while never holding more than
+    prefetch games that haven't been consumed.
+
+    If the consumer stops early, the game being loaded is finished and
+    no more games are loaded.
+    """
+    done = object()
+    results = Queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def load():
+        try:
+            for eid in eids:
+                if stop.is_set() or not put((Game(eid), None)):
+                    return
+        except Exception:
+            # Once the consumer has stopped, nobody is left to report to.
+            if not stop.is_set():
+                put((None, sys.exc_info()))
+            return
+        put((done, None))
+
+    loader = threading.Thread(target=load)
+    loader.daemon = True
+    loader.start()
+    try:
+        while True:
+            g, exc_info = results.get()
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            if g is done:
+                break
+            if g is not None:
+                yield g
+    finally:
+        # Wait for the game being loaded, if any, so that the loader
+        # isn't still running when the interpreter exits.
+        stop.set()
+        loader.join()
+
+
+def _is_cached(eid):
+    """
+    Returns true if the data for the game represented by eid is already
+    on disk, either in a store, in an archive or in its own gzipped file.
+    """
+    return (nflgame.store.contains(eid)
+            or nflgame.archive.contains(eid)
+            or os.access(_jsonf % eid, os.R_OK))
+
+
 def _tryint(v):
     """
     Tries to convert v to an integer. If it fails, return 0.
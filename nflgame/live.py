@@ -50,6 +50,7 @@ except ImportError:
 
 import nflgame
 import nflgame.game
+import nflgame.sched
 
 # [00:21] <rasher> burntsushi: Alright, the schedule changes on Wednesday 7:00
 # UTC during the regular season
@@ -342,10 +343,7 @@ def _game_is_active(gameinfo, inactive_interval):
 
 
 def _game_datetime(info):
-    hour, minute = info['time'].strip().split(':')
-    d = datetime.datetime(int(info['eid'][:4]), info['month'], info['day'],
-                          (int(hour) + 12) % 24, int(minute))
-    return pytz.timezone('US/Eastern').localize(d).astimezone(pytz.utc)
+    return nflgame.sched.kickoff(info)
 
 
 def _now():
@@ -1,31 +1,244 @@
 from __future__ import division
 
-import json
+import array
+import bisect
+import collections
+import difflib
 import os.path
+import re
+import threading
 
 from nflgame import OrderedDict
+import nflgame.decoder
 import nflgame.seq
 import nflgame.statmap
 
 _player_json_file = os.path.join(os.path.dirname(__file__), 'players.json')
 
 
+_record_key = re.compile(r'^    "([^"]+)": \{', re.MULTILINE)
+"""
+Matches the key of a player record in a players.json file written by
+`nflgame-update-players`, which indents each record by four spaces.
+"""
+
+
 def _create_players(jsonf=None):
     """
-    Creates a dict of Player objects from the players.json file, keyed
-    by GSIS ids.
+    Creates a lazily loaded mapping of Player objects from the players.json
+    file, keyed by GSIS ids.
     """
     if jsonf is None:
         jsonf = _player_json_file
-    try:
-        data = json.loads(open(jsonf).read())
-    except IOError:
-        return {}
+    return Players(jsonf)
+
+
+class Players (collections.MutableMapping):
+    """
+    Players is a mapping of GSIS ids to Player objects that is loaded from
+    a players.json file the first time it is used.
+
+    When it is first used, the file is read and scanned for the location of
+    each player's record, but no records are decoded. Each record is then
+    decoded into a Player the first time it is looked up. If the file isn't
+    laid out the way `nflgame-update-players` writes it, every record is
+    decoded at once instead.
+
+    If the file can't be read, the mapping is empty.
+    """
+    def __init__(self, jsonf):
+        self._jsonf = jsonf
+        self._text = None
+        self._records = None
+        self._players = {}
+        self._index = None
+        self._lock = threading.RLock()
+
+    def _load(self):
+        """
+        Reads the file and finds the location of every record, if it
+        hasn't been done already. Returns a dict mapping GSIS ids to either
+        the location (start, end) of a record in the file or, for players
+        that have already been decoded, None.
+        """
+        if self._records is not None:
+            return self._records
+        with self._lock:
+            if self._records is not None:
+                return self._records
+            try:
+                text = open(self._jsonf).read()
+            except IOError:
+                self._records = {}
+                return self._records
+
+            matches = list(_record_key.finditer(text))
+            records = {}
+            for i, m in enumerate(matches):
+                if i + 1 < len(matches):
+                    end = matches[i + 1].start()
+                else:
+                    end = text.rindex('}')
+                records[m.group(1)] = (m.end() - 1, end)
+            if len(records) == 0:
+                for playerid, data in nflgame.decoder.loads(text).iteritems():
+                    self._players[playerid] = Player(data)
+                    records[playerid] = None
+            self._text = text
+            self._records = records
+        return self._records
+
+    def __getitem__(self, playerid):
+        player = self._players.get(playerid)
+        if player is not None:
+            return player
+        loc = self._load()[playerid]
+        with self._lock:
+            if playerid not in self._players:
+                start, end = loc
+                raw = self._text[start:end].rstrip().rstrip(',')
+                self._players[playerid] = Player(nflgame.decoder.loads(raw))
+            return self._players[playerid]
+
+    def __setitem__(self, playerid, player):
+        with self._lock:
+            self._load()[playerid] = None
+            self._players[playerid] = player
+            self._index = None
+
+    def __delitem__(self, playerid):
+        with self._lock:
+            del self._load()[playerid]
+            self._players.pop(playerid, None)
+            self._index = None
+
+    def __contains__(self, playerid):
+        return playerid in self._players or playerid in self._load()
+
+    def __iter__(self):
+        return iter(list(self._load()))
+
+    def __len__(self):
+        return len(self._load())
+
+    def index(self):
+        """
+        Returns the name indexes of every player in this mapping as a
+        `nflgame.player.NameIndex`. They are built the first time this is
+        called (which decodes every player) and rebuilt after players are
+        added or removed.
+        """
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = NameIndex(self.itervalues())
+                index = self._index
+        return index
+
+
+class NameIndex (object):
+    """
+    NameIndex holds case folded indexes of player names, which are used to
+    find players by name without looking at every player.
+
+    Exact lookups match a player's full name (e.g., "Tom Brady"), and GSIS
+    lookups match a player's GSIS name (e.g., "T.Brady"). Prefix and fuzzy
+    lookups match any of those names or a player's last name. Fuzzy
+    lookups use an index of the three letter substrings of every name to
+    find candidates, which are then ranked by `difflib.SequenceMatcher`.
+    """
+    def __init__(self, players):
+        self.by_name = {}
+        self.by_gsis_name = {}
+        self.by_key = {}
+        self.grams = {}
+        for p in players:
+            full, gsis = p.name.lower(), p.gsis_name.lower()
+            self.by_name.setdefault(full, []).append(p)
+            if gsis:
+                self.by_gsis_name.setdefault(gsis, []).append(p)
+            for key in set((full, gsis, p.last_name.lower())):
+                if key:
+                    self.by_key.setdefault(key, []).append(p)
+        self.keys = sorted(self.by_key)
+        for key in self.keys:
+            for gram in _grams(key):
+                self.grams.setdefault(gram, []).append(key)
+
+    def exact(self, name):
+        """
+        Returns a list of players whose full name is name, ignoring case.
+        """
+        return list(self.by_name.get(name.lower(), []))
+
+    def gsis(self, name):
+        """
+        Returns a list of players whose GSIS name is name, ignoring case.
+        """
+        return list(self.by_gsis_name.get(name.lower(), []))
+
+    def prefix(self, name):
+        """
+        Returns a list of players with a full name, GSIS name or last name
+        that starts with name, ignoring case. Players are ordered by the
+        name that matched.
+        """
+        name = name.lower()
+        keys = []
+        i = bisect.bisect_left(self.keys, name)
+        while i < len(self.keys) and self.keys[i].startswith(name):
+            keys.append(self.keys[i])
+            i += 1
+        return self._players(keys)
+
+    def fuzzy(self, name, cutoff=0.8):
+        """
+        Returns a list of players with a full name, GSIS name or last name
+        that is similar to name, ignoring case. Names are compared with
+        `difflib.SequenceMatcher`, and a name matches when the ratio of
+        their similarity is at least cutoff. Players are ordered from most
+        to least similar.
+        """
+        name = name.lower()
+        grams = _grams(name)
+        shared = {}
+        for gram in grams:
+            for key in self.grams.get(gram, []):
+                shared[key] = shared.get(key, 0) + 1
+
+        # Only names sharing at least a third of the substrings of name are
+        # compared, which prunes most candidates cheaply.
+        need = max(1, len(grams) // 3)
+        scored = []
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(name)
+        for key, n in shared.iteritems():
+            if n < need:
+                continue
+            matcher.set_seq1(key)
+            if matcher.real_quick_ratio() < cutoff \
+                    or matcher.quick_ratio() < cutoff:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= cutoff:
+                scored.append((-ratio, key))
+        return self._players(key for _, key in sorted(scored))
+
+    def _players(self, keys):
+        seen, players = set(), []
+        for key in keys:
+            for p in self.by_key[key]:
+                if p.player_id not in seen:
+                    seen.add(p.player_id)
+                    players.append(p)
+        return players
+
 
-    players = {}
-    for playerid in data:
-        players[playerid] = Player(data[playerid])
-    return players
+def _grams(s):
+    """Returns the set of three letter substrings of s, padded at the ends."""
+    s = '  %s ' % s
+    return set(s[i:i + 3] for i in xrange(len(s) - 2))
 
 
 class Player (object):
@@ -116,7 +329,17 @@ class PlayerStats (object):
 
         if 'passing_yds' in player.__dict__:
             # Do something with player.passing_yds
+
+    Statistics are stored compactly, since there may be hundreds of
+    thousands of these objects. Each object has a vector of the statistics
+    it has, identified by their position in the registry of field names at
+    `nflgame.statmap.fields`, in the order they were first added. Other
+    attributes are kept in slots. As a result, `__dict__` is a snapshot of
+    the player's attributes and statistics; changing it has no effect.
     """
+    __slots__ = ('playerid', 'name', 'home', 'team', 'player',
+                 '_ids', '_vals', '_attrs')
+
     def __init__(self, playerid, name, home, team):
         """
         Create a new Player instance with the player id (from NFL.com's
@@ -127,15 +350,15 @@ class PlayerStats (object):
         self.name = name
         self.home = home
         self.team = team
-        self._stats = OrderedDict()
-
-        self.player = None
-        if self.playerid in nflgame.players:
-            self.player = nflgame.players[self.playerid]
+        self._ids = array.array('H')
+        self._vals = []
+        self._attrs = None
+        self.player = nflgame.players.get(self.playerid)
 
     def has_cat(self, cat):
-        for f in self._stats:
-            if f.startswith(cat):
+        fields = nflgame.statmap.fields
+        for i in self._ids:
+            if fields[i].startswith(cat):
                 return True
         return False
 
@@ -177,7 +400,7 @@ class PlayerStats (object):
         all statistical categories.
         """
         n = 0
-        for f, v in self.__dict__.iteritems():
+        for f, v in self._items():
             if f.endswith('tds'):
                 n += v
         return n
@@ -217,26 +440,77 @@ class PlayerStats (object):
         """
         Returns a dict of all stats for the player.
         """
-        return self._stats
+        return OrderedDict(self._items())
+
+    @property
+    def __dict__(self):
+        d = {}
+        for cls in type(self).__mro__:
+            for k in getattr(cls, '__slots__', ()):
+                if not k.startswith('_'):
+                    d[k] = getattr(self, k)
+        if self._attrs is not None:
+            d.update(self._attrs)
+        d.update(self._items())
+        return d
 
     def formatted_stats(self):
         """
         Returns a roughly-formatted string of all statistics for this player.
         """
         s = []
-        for stat, val in self._stats.iteritems():
+        for stat, val in self._items():
             s.append('%s: %s' % (stat, val))
         return ', '.join(s)
 
+    def _items(self):
+        """Returns a list of (field, value) pairs of this player's stats."""
+        fields = nflgame.statmap.fields
+        return [(fields[i], v) for i, v in zip(self._ids, self._vals)]
+
+    def _get(self, fid, default=None):
+        """Returns the value of the stat with field id fid, or default."""
+        try:
+            return self._vals[self._ids.index(fid)]
+        except ValueError:
+            return default
+
+    def _put(self, fid, v):
+        """Sets the stat with field id fid to v."""
+        try:
+            self._vals[self._ids.index(fid)] = v
+        except ValueError:
+            self._ids.append(fid)
+            self._vals.append(v)
+
     def _add_stats(self, stats):
+        field_id = nflgame.statmap.field_id
         for k, v in stats.iteritems():
-            self.__dict__[k] = self.__dict__.get(k, 0) + v
-            self._stats[k] = self.__dict__[k]
+            fid = field_id(k)
+            self._put(fid, self._get(fid, 0) + v)
 
     def _overwrite_stats(self, stats):
+        field_id = nflgame.statmap.field_id
         for k, v in stats.iteritems():
-            self.__dict__[k] = v
-            self._stats[k] = self.__dict__[k]
+            self._put(field_id(k), v)
+
+    def _copy(self):
+        """
+        Returns a copy of this player that shares none of its mutable
+        state with this player.
+        """
+        new_player = type(self).__new__(type(self))
+        new_player.__setstate__(self.__getstate__())
+        object.__setattr__(new_player, '_ids', array.array('H', self._ids))
+        object.__setattr__(new_player, '_vals', list(self._vals))
+        if self._attrs is not None:
+            object.__setattr__(new_player, '_attrs', dict(self._attrs))
+        return new_player
+
+    def _add_player(self, other):
+        """Adds the stats of the player other to this player's stats."""
+        for fid, v in zip(other._ids, other._vals):
+            self._put(fid, self._get(fid, 0) + v)
 
     def __str__(self):
         """
@@ -266,8 +540,9 @@ class PlayerStats (object):
         else:
             home = self.home
         new_player = self.__class__(self.playerid, self.name, home, self.team)
-        new_player._add_stats(self._stats)
-        new_player._add_stats(other._stats)
+        new_player._ids.extend(self._ids)
+        new_player._vals.extend(self._vals)
+        new_player._add_player(other)
 
         return new_player
 
@@ -277,19 +552,17 @@ class PlayerStats (object):
 
         new_player = GamePlayerStats(self.playerid,
                                      self.name, self.home, self.team)
-        new_player._add_stats(self._stats)
-        for bk, bv in other._stats.iteritems():
-            if bk not in new_player._stats:  # stat was taken away? ignore.
-                continue
-
-            new_player._stats[bk] -= bv
-            if new_player._stats[bk] == 0:
-                del new_player._stats[bk]
-            else:
-                new_player.__dict__[bk] = new_player._stats[bk]
+        for fid, v in zip(self._ids, self._vals):
+            bv = other._get(fid)
+            if bv is not None:  # stat was taken away? ignore.
+                v -= bv
+                if v == 0:
+                    continue
+            new_player._ids.append(fid)
+            new_player._vals.append(v)
 
         anydiffs = False
-        for k, v in new_player._stats.iteritems():
+        for v in new_player._vals:
             if v > 0:
                 anydiffs = True
                 break
@@ -298,12 +571,43 @@ class PlayerStats (object):
         return new_player
 
     def __getattr__(self, name):
+        fid = nflgame.statmap.field_ids.get(name)
+        if fid is not None:
+            try:
+                return self._vals[self._ids.index(fid)]
+            except ValueError:
+                pass
+        if name != '_attrs' and self._attrs is not None \
+                and name in self._attrs:
+            return self._attrs[name]
+
         # If name has one of the categories as a prefix, then return
         # a default value of zero
         for cat in nflgame.statmap.categories:
             if name.startswith(cat):
                 return 0
-        raise AttributeError
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        # Attributes that aren't slots are kept in a dict that is only
+        # created when one is set.
+        try:
+            object.__setattr__(self, name, value)
+        except AttributeError:
+            if self._attrs is None:
+                object.__setattr__(self, '_attrs', {})
+            self._attrs[name] = value
+
+    def __getstate__(self):
+        state = {}
+        for cls in type(self).__mro__:
+            for k in getattr(cls, '__slots__', ()):
+                state[k] = getattr(self, k)
+        return state
+
+    def __setstate__(self, state):
+        for k, v in state.iteritems():
+            object.__setattr__(self, k, v)
 
     def passer_rating(self):
         """
@@ -333,6 +637,8 @@ class PlayerStats (object):
 
 
 class GamePlayerStats (PlayerStats):
+    __slots__ = ('games',)
+
     def __init__(self, playerid, name, home, team):
         super(GamePlayerStats, self).__init__(playerid, name, home, team)
         self.games = 1
@@ -344,4 +650,70 @@ class GamePlayerStats (PlayerStats):
 
 
 class PlayPlayerStats (PlayerStats):
-    pass
+    __slots__ = ()
+
+
+class Accumulator (object):
+    """
+    Accumulator sums player statistics into a single table keyed by
+    player id, in one pass and without creating new objects for every
+    merge.
+
+    The first time a player is added, a copy of it is put in the table.
+    Statistics from later additions of the same player are added to that
+    copy in place, so the cost of adding a player depends only on the
+    number of statistics it has. Players that are added are never changed.
+
+    Adding players to an accumulator has the same effect as adding
+    sequences of player statistics together with `+`: players are kept in
+    the order they were first seen, the 'home' property becomes None when
+    it differs between additions and the 'games' property of
+    GamePlayerStats is summed.
+    """
+    def __init__(self):
+        self._players = OrderedDict()
+        self._positions = {}
+
+    def add(self, player):
+        """
+        Adds the statistics of player to the table.
+        """
+        pid = player.playerid
+        acc = self._players.get(pid)
+        if acc is None:
+            acc = player._copy()
+            self._players[pid] = acc
+            self._positions[pid] = dict((fid, i)
+                                        for i, fid in enumerate(acc._ids))
+            return
+        assert type(acc) == type(player)
+
+        if acc.home != player.home:
+            acc.home = None
+        if isinstance(acc, GamePlayerStats):
+            acc.games += player.games
+        positions = self._positions[pid]
+        ids, vals = acc._ids, acc._vals
+        for fid, v in zip(player._ids, player._vals):
+            i = positions.get(fid)
+            if i is None:
+                positions[fid] = len(vals)
+                ids.append(fid)
+                vals.append(v)
+            else:
+                vals[i] += v
+
+    def add_all(self, players):
+        """
+        Adds the statistics of every player in the iterable players to the
+        table.
+        """
+        for p in players:
+            self.add(p)
+
+    def players(self):
+        """
+        Returns the players in the table as a `nflgame.seq.GenPlayerStats`
+        sequence.
+        """
+        return nflgame.seq.GenPlayerStats(self._players)
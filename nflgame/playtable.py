@@ -0,0 +1,571 @@
+"""
+The playtable module provides a columnar table of plays that can be
+searched without creating a `nflgame.game.Play` object for every play.
+
+Searching many seasons of plays with `nflgame.combine_plays` means
+decoding every game and building a Play object (along with the statistics
+of every player in it) for each of hundreds of thousands of plays, only to
+throw most of them away. A play table is built once, saved to a file and
+loaded in a fraction of a second. Each column of the table is a compact
+array with one value per play, and searches work a column at a time::
+
+    import nflgame
+    import nflgame.playtable
+
+    games = nflgame.games_gen(range(2009, 2015))
+    nflgame.playtable.build(games).save('plays.table')
+
+    table = nflgame.playtable.load('plays.table')
+    plays = table.filter(down=3, yards_togo__ge=8, yardline__ge=30,
+                         passing_att=1)
+    for p in plays.sort('passing_yds').limit(10):
+        print p.eid, p.team, p.qtr, p.clock, p.passing_yds
+
+The table has the following columns: `eid`, `drive` (the drive number),
+`playid`, `team` (the team with possession), `down`, `yards_togo`,
+`yardline` (the offset of the line of scrimmage, as in
+`nflgame.game.FieldPosition`), `qtr`, `clock` (the number of seconds left
+in the quarter) and one column for every statistical field in
+`nflgame.statmap.idmap`. Plays where a value is unknown (like the field
+position of a timeout) hold `nflgame.playtable.NULL`.
+
+A table supports the same `filter`, `sort` and `limit` methods as
+`nflgame.seq.GenPlays`, and iterating over a table gives rows with the
+columns as attributes. The Play objects for the rows of a table can be
+retrieved with `plays`.
+
+When NumPy is installed, columns are NumPy arrays and searches are done
+with array operations. Otherwise columns are `array.array` values and
+searches are plain loops over a column, which are still much faster than
+searching Play objects.
+
+The format of a saved table starts with an 8 byte magic string, followed
+by the length of a header as a big endian unsigned 64 bit integer and the
+header itself, which is a JSON object describing the number of rows and
+the name, type and categories of each column. Next come the contents of
+each column as raw machine values.
+"""
+from __future__ import absolute_import, division, print_function
+import argparse
+import array
+import itertools
+import json
+import operator
+import struct
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from nflgame import OrderedDict
+from nflgame import statmap
+from nflgame.datafile import eprint
+import nflgame.datafile
+import nflgame.seq
+
+_MAGIC = 'NFLGPTB1'
+"""The magic string at the start of every saved table."""
+
+_HEADER = struct.Struct('>Q')
+"""The encoding of the length of the header of a saved table."""
+
+NULL = -2 ** 31
+"""The value of an integer column for plays where the value is unknown."""
+
+_CATEGORICAL = ('eid', 'team')
+"""
+Columns whose values are strings. They are stored as integer codes into
+a list of the distinct values of the column.
+"""
+
+_INTEGER = ('drive', 'playid', 'down', 'yards_togo', 'yardline', 'qtr',
+            'clock')
+"""Columns of information about each play other than statistics."""
+
+stat_fields = sorted(set(name for info in statmap.idmap.itervalues()
+                         for name in [info['yds']] + info['fields']
+                         if name))
+"""The statistical fields that have a column in a play table."""
+
+_STAT_FIELDS = frozenset(stat_fields)
+
+_FRACTIONAL = frozenset(name for info in statmap.idmap.itervalues()
+                        if info.get('value', 1) != int(info.get('value', 1))
+                        for name in info['fields'])
+"""Statistical fields that may hold fractions, like split sacks."""
+
+
+def _typecode(name):
+    if name in _CATEGORICAL or name in _INTEGER:
+        return 'i'
+    if name in _FRACTIONAL:
+        return 'f'
+    return 'h'
+
+
+def _clock(time):
+    """
+    Returns the number of seconds left in the quarter given a clock
+    like `12:34`, or NULL if the clock can't be read.
+    """
+    try:
+        minutes, seconds = map(int, time.split(':'))
+    except (ValueError, AttributeError):
+        return NULL
+    return minutes * 60 + seconds
+
+
+def _null(name, v):
+    """Returns true if v is an unknown value of the column called name."""
+    return v == NULL and name in _INTEGER
+
+
+def _int(v):
+    try:
+        return int(v)
+    except (ValueError, TypeError):
+        return NULL
+
+
+class _Builder (object):
+    """
+    _Builder appends plays to the columns of a new play table. Stat
+    columns are only created once a play has a value for them, since most
+    statistical fields are zero in almost every play.
+    """
+    def __init__(self):
+        self.n = 0
+        self.columns = OrderedDict((name, array.array('i'))
+                                   for name in _CATEGORICAL + _INTEGER)
+        self.codes = dict((name, {}) for name in _CATEGORICAL)
+        self.categories = dict((name, []) for name in _CATEGORICAL)
+        self.stats = {}
+
+    def _code(self, name, value):
+        codes = self.codes[name]
+        if value not in codes:
+            codes[value] = len(codes)
+            self.categories[name].append(value)
+        return codes[value]
+
+    def add(self, eid, play):
+        data, cols = play.data, self.columns
+        cols['eid'].append(self._code('eid', eid))
+        cols['team'].append(self._code('team', play.team))
+        cols['drive'].append(play.drive.drive_num)
+        cols['playid'].append(int(play.playid))
+        cols['down'].append(play.down)
+        cols['yards_togo'].append(play.yards_togo)
+        if play.yardline is None:
+            cols['yardline'].append(NULL)
+        else:
+            cols['yardline'].append(play.yardline.offset)
+        cols['qtr'].append(_int(data['qtr']))
+        cols['clock'].append(_clock(data['time']))
+
+        for name in play._stats:
+            if name not in self.stats and name in _STAT_FIELDS:
+                col = array.array(_typecode(name), [0]) * self.n
+                self.stats[name] = col
+        get = play._stats.get
+        for name, col in self.stats.iteritems():
+            col.append(get(name, 0))
+        self.n += 1
+
+    def table(self):
+        columns = OrderedDict(self.columns)
+        for name in stat_fields:
+            if name in self.stats:
+                columns[name] = self.stats[name]
+        return PlayTable(self.n, columns, self.categories)
+
+
+def build(games):
+    """
+    Returns a new play table of every play in games, which may be any
+    iterable of `nflgame.game.Game` objects (like the generator returned
+    by `nflgame.games_gen`). Games are only looked at one at a time, so
+    they don't all need to fit in memory.
+    """
+    b = _Builder()
+    for g in games:
+        for d in g.drives:
+            for p in d.plays:
+                b.add(g.eid, p)
+    return b.table()
+
+
+def load(fpath):
+    """
+    Returns the play table saved at fpath with `PlayTable.save`. An
+    IOError is raised if fpath is not a saved play table.
+    """
+    with open(fpath, 'rb') as f:
+        buf = f.read()
+    if buf[:len(_MAGIC)] != _MAGIC:
+        raise IOError('"%s" is not an nflgame play table.' % fpath)
+    start = len(_MAGIC) + _HEADER.size
+    hlen = _HEADER.unpack(buf[len(_MAGIC):start])[0]
+    header = json.loads(buf[start:start + hlen])
+    n, offset = header['rows'], start + hlen
+
+    columns = OrderedDict()
+    for name, typecode, itemsize in header['columns']:
+        col = array.array(str(typecode))
+        if col.itemsize != itemsize:
+            raise IOError('"%s" was saved on an incompatible machine.'
+                          % fpath)
+        col.fromstring(buf[offset:offset + n * itemsize])
+        if header['byteorder'] != sys.byteorder:
+            col.byteswap()
+        columns[name] = col
+        offset += n * itemsize
+    return PlayTable(n, columns, header['categories'])
+
+
+class Row (object):
+    """
+    Row is a single play in a play table. Every column of the table is an
+    attribute of the row. Statistical fields without a column are zero,
+    just like they are for a `nflgame.game.Play`, and unknown values are
+    None.
+    """
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        try:
+            return self.table._value(name, self.index)
+        except KeyError:
+            raise AttributeError(name)
+
+    def play(self):
+        """Returns the `nflgame.game.Play` object of this row."""
+        return self.table._play(self.index)
+
+    def __str__(self):
+        return '(%s, %s, Q%s, %s and %s) playid %s' \
+               % (self.eid, self.team, self.qtr, self.down, self.yards_togo,
+                  self.playid)
+
+
+class PlayTable (object):
+    """
+    PlayTable is a sequence of plays stored as columns. The sequences
+    returned by `filter`, `sort` and `limit` share the columns of the
+    table they came from and only keep a list of the rows they select, so
+    they are cheap to create and can be iterated over any number of times.
+    """
+    def __init__(self, n, columns, categories, rows=None):
+        self.n = n
+        self.categories = categories
+        self._columns = columns
+        self._rows = rows
+        self._games = {}
+        if numpy is not None:
+            for name, col in columns.iteritems():
+                if not isinstance(col, numpy.ndarray):
+                    columns[name] = numpy.frombuffer(col, dtype=col.typecode)
+            if rows is not None and not isinstance(rows, numpy.ndarray):
+                self._rows = numpy.array(rows, dtype='i')
+
+    def _view(self, rows):
+        t = PlayTable(self.n, self._columns, self.categories, rows)
+        t._games = self._games
+        return t
+
+    def _all_rows(self):
+        if self._rows is not None:
+            return self._rows
+        if numpy is not None:
+            return numpy.arange(self.n, dtype='i')
+        return array.array('i', xrange(self.n))
+
+    def columns(self):
+        """
+        Returns the names of the columns of this table. Statistical
+        fields that are zero in every play do not have a column.
+        """
+        return self._columns.keys()
+
+    def _column(self, name):
+        """
+        Returns the full column called name. Statistical fields without a
+        column get a column of zeros.
+        """
+        if name in self._columns:
+            return self._columns[name]
+        if name not in _STAT_FIELDS:
+            raise KeyError('"%s" is not a column of the play table.' % name)
+        if numpy is not None:
+            return numpy.zeros(self.n, dtype=_typecode(name))
+        return array.array(_typecode(name), [0]) * self.n
+
+    def _select(self, name):
+        """Returns the values of the column called name for each row."""
+        col = self._column(name)
+        if self._rows is None:
+            return col
+        if numpy is not None:
+            return col[self._rows]
+        return map(col.__getitem__, self._rows)
+
+    def column(self, name):
+        """
+        Returns the values of the column called name for each row of this
+        table, in order. Values of the eid and team columns are strings.
+        Other values are numbers, where unknown values are NULL.
+
+        When NumPy is installed, numeric values are returned as a NumPy
+        array, which makes this the quickest way to compute aggregates
+        like sums and averages over the plays in a table.
+        """
+        vals = self._select(name)
+        if name in _CATEGORICAL:
+            cats = self.categories[name]
+            return [cats[c] for c in vals]
+        if numpy is None:
+            return list(vals)
+        return vals
+
+    def _value(self, name, i):
+        v = self._column(name)[i]
+        if name in _CATEGORICAL:
+            return self.categories[name][v]
+        if _null(name, v):
+            return None
+        return v.item() if numpy is not None else v
+
+    def filter(self, **kwargs):
+        """
+        Returns the rows of this table that satisfy every criterion given,
+        in the same way as `nflgame.seq.Gen.filter`. Each criterion names a
+        column and may end with any of the suffixes in
+        `nflgame.seq._BUILTIN_PREDS`. For example, to find third and long
+        passes in the red zone::
+
+            table.filter(down=3, yards_togo__ge=8, yardline__ge=30,
+                         passing_att=1)
+
+        Rows where the value of a column is unknown are excluded, just like
+        items without a field are excluded by `nflgame.seq.Gen.filter`.
+
+        Criteria on the eid and team columns are tested once against each
+        distinct value of the column. Criteria given as a function are
+        tested once against each distinct value in the rows being searched.
+        """
+        rows = self._rows
+        for field, value in kwargs.iteritems():
+            rows = self._view(rows)._filter(field, value)
+        return self._view(rows)
+
+    def _filter(self, field, value):
+        """
+        Returns the rows of this table satisfying the criterion
+        `field=value`.
+        """
+        test = None
+        for suffix, p in nflgame.seq._BUILTIN_PREDS.iteritems():
+            if field.endswith(suffix):
+                field, test = field[:-len(suffix)], p
+                break
+        if test is None:
+            if isinstance(value, nflgame.seq._FUNCTION):
+                test = nflgame.seq._call
+            else:
+                test = operator.eq
+
+        vals, rows = self._select(field), self._all_rows()
+        if field in _CATEGORICAL:
+            codes = [c for c, cat in enumerate(self.categories[field])
+                     if test(cat, value)]
+            return _select_in(rows, vals, codes)
+
+        if numpy is not None:
+            if test is nflgame.seq._in:
+                mask = numpy.in1d(vals, list(value))
+            elif test is nflgame.seq._between:
+                mask = (vals >= value[0]) & (vals <= value[1])
+            elif test in (nflgame.seq._call, operator.contains):
+                distinct = [v.item() for v in numpy.unique(vals)]
+                return _select_in(rows, vals, [v for v in distinct
+                                               if test(v, value)
+                                               and not _null(field, v)])
+            else:
+                mask = test(vals, value)
+            if field in _INTEGER:
+                mask &= vals != NULL
+            return rows[mask]
+
+        if test is nflgame.seq._in:
+            try:
+                value = frozenset(value)
+            except TypeError:
+                pass
+        elif test is nflgame.seq._call:
+            return _select_in(rows, vals, [v for v in set(vals)
+                                           if value(v)
+                                           and not _null(field, v)])
+        keep = list(itertools.compress(rows, itertools.imap(
+            test, vals, itertools.repeat(value))))
+        if field in _INTEGER:
+            col = self._column(field)
+            keep = [i for i in keep if col[i] != NULL]
+        return array.array('i', keep)
+
+    def sort(self, field, descending=True):
+        """
+        Returns the rows of this table sorted by the column field, in the
+        same way as `nflgame.seq.Gen.sort`. field may also be a list of
+        columns, in which case ties are broken by the following columns.
+        Rows that are still tied keep their order.
+
+        The eid and team columns are sorted by their string values. Unknown
+        values are smaller than every other value, so they come last when
+        descending is true and first otherwise.
+        """
+        fields = [field] if isinstance(field, basestring) else list(field)
+        rows = self._all_rows()
+        if numpy is not None:
+            keys = [self._sort_key(f, self._select(f)) for f in fields]
+            if descending:
+                keys = [-k.astype('f8') for k in keys]
+            return self._view(rows[numpy.lexsort(keys[::-1])])
+
+        rows = list(rows)
+        for f in reversed(fields):
+            key = self._sort_key(f, self._column(f))
+            rows.sort(key=key.__getitem__, reverse=descending)
+        return self._view(array.array('i', rows))
+
+    def _sort_key(self, field, vals):
+        """
+        Returns a column that sorts in the same order as the values of
+        field, which is only different from vals for the eid and team
+        columns.
+        """
+        if field not in _CATEGORICAL:
+            return vals
+        cats = self.categories[field]
+        ranks = [0] * len(cats)
+        order = sorted(range(len(cats)), key=cats.__getitem__)
+        for rank, c in enumerate(order):
+            ranks[c] = rank
+        if numpy is not None:
+            return numpy.array(ranks, dtype='i')[vals]
+        return [ranks[c] for c in vals]
+
+    def limit(self, n):
+        """Limit the table to its first n rows."""
+        return self._view(self._all_rows()[:n])
+
+    def __len__(self):
+        if self._rows is None:
+            return self.n
+        return len(self._rows)
+
+    def __iter__(self):
+        for i in self._all_rows():
+            yield Row(self, int(i))
+
+    def __getitem__(self, i):
+        """
+        Returns the row at index i, or a table of the rows in a slice.
+        """
+        if isinstance(i, slice):
+            return self._view(self._all_rows()[i])
+        return Row(self, int(self._all_rows()[i]))
+
+    def _play(self, i):
+        """Returns the `nflgame.game.Play` object of the row i."""
+        import nflgame.game
+
+        eid = self._value('eid', i)
+        if eid not in self._games:
+            g = nflgame.game.Game(eid)
+            self._games[eid] = dict((p.playid, p)
+                                    for d in g.drives for p in d.plays)
+        return self._games[eid][str(self._value('playid', i))]
+
+    def plays(self):
+        """
+        Returns a `nflgame.seq.GenPlays` of the Play objects of the rows
+        in this table, in order. Each game is only loaded once, the first
+        time one of its plays is needed, and is remembered by the table.
+        """
+        return nflgame.seq.GenPlays(self._play(int(i))
+                                    for i in self._all_rows())
+
+    def save(self, fpath):
+        """
+        Saves every row of this table to fpath, so that it can be loaded
+        later with `nflgame.playtable.load`.
+        """
+        rows = self._rows
+        columns = [(name, self._column(name)) for name in self.columns()]
+        if rows is not None:
+            columns = [(name, col[rows] if numpy is not None
+                        else array.array(col.typecode,
+                                         map(col.__getitem__, rows)))
+                       for name, col in columns]
+        header = {
+            'rows': len(self),
+            'byteorder': sys.byteorder,
+            'categories': self.categories,
+            'columns': [(name, _typecode(name), col.itemsize)
+                        for name, col in columns],
+        }
+        blob = json.dumps(header, sort_keys=True, separators=(',', ':'))
+        with nflgame.datafile.atomic_write(fpath) as out:
+            out.write(_MAGIC)
+            out.write(_HEADER.pack(len(blob)))
+            out.write(blob)
+            for _, col in columns:
+                out.write(col.tostring())
+
+
+def _select_in(rows, vals, codes):
+    """
+    Returns the rows whose value in vals is one of codes. vals has a
+    value for each of the rows.
+    """
+    if numpy is not None:
+        return rows[numpy.in1d(vals, codes)]
+    codes = frozenset(codes)
+    return array.array('i', itertools.compress(
+        rows, itertools.imap(codes.__contains__, vals)))
+
+
+def run():
+    import nflgame
+
+    parser = argparse.ArgumentParser(
+        description='Builds a columnar table of every play in the games of '
+                    'one or more seasons, which can be loaded and searched '
+                    'with nflgame.playtable.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    aa = parser.add_argument
+    aa('output', type=str, help='The file to write the table to.')
+    aa('--years', type=int, nargs='+', required=True,
+       help='The seasons to include in the table.')
+    aa('--kind', type=str, default='REG', choices=['PRE', 'REG', 'POST'],
+       help='The part of each season to include in the table.')
+    args = parser.parse_args()
+
+    games = nflgame.games_gen(args.years, kind=args.kind)
+    if games is None:
+        eprint('No games were found.')
+        sys.exit(1)
+    table = build(games)
+    table.save(args.output)
+    print('Wrote %d plays to %s' % (len(table), args.output))
+
+if __name__ == '__main__':
+    run()
@@ -2,14 +2,65 @@ try:
     from collections import OrderedDict
 except:
     from ordereddict import OrderedDict  # from PyPI
+import atexit
+import bisect
 import datetime
-import json
+import os
 import os.path
+import threading
+
+import nflgame.decoder
 
 __pdoc__ = {}
 
 _sched_json_file = os.path.join(os.path.dirname(__file__), 'schedule.json')
 
+offline = os.getenv('NFLGAME_OFFLINE', '') not in ('', '0')
+"""
+When true, the schedule is never updated from NFL.com, no matter how old
+it is. This is set from the `NFLGAME_OFFLINE` environment variable, which
+must be set before nflgame is imported to prevent the update that may
+happen at import time.
+"""
+
+refresh_mode = os.getenv('NFLGAME_SCHED_REFRESH') or 'never'
+"""
+How a schedule that is more than a day old is updated when nflgame is
+imported. This is set from the `NFLGAME_SCHED_REFRESH` environment
+variable and must be one of the following:
+
+`never`, the default, doesn't update the schedule at import time, so
+importing nflgame never waits on the network. The schedule is updated
+on demand with `nflgame.sched.refresh` or the `nflgame-update-schedule`
+script.
+
+`background` starts the update on a daemon thread. `nflgame.sched.games`
+is replaced with the updated schedule when the update finishes. If the
+update fails, the schedule that was read from disk is kept. When the
+interpreter exits, it waits up to `nflgame.sched.exit_wait` seconds for
+the update to finish, and the update is given up otherwise.
+
+`sync` updates the schedule before the import finishes, which is how
+nflgame has always behaved.
+
+Any other value is an error.
+"""
+
+_refresh_modes = ('never', 'background', 'sync')
+if refresh_mode not in _refresh_modes:
+    raise ValueError('NFLGAME_SCHED_REFRESH must be one of %s, not "%s".'
+                     % (', '.join(_refresh_modes), refresh_mode))
+
+exit_wait = 2
+"""
+The number of seconds that the interpreter waits on exit for an update
+of the schedule on a daemon thread to finish.
+"""
+
+_refresh_lock = threading.Lock()
+_refresh_thread = None
+_exiting = threading.Event()
+
 
 def _create_schedule(jsonf=None):
     """
@@ -18,33 +69,289 @@ def _create_schedule(jsonf=None):
     started. Keys in the dictionary are GSIS ids and values are
     dictionaries with the following keys: week, month, year, home,
     away, wday, gamekey, season_type, time.
+
+    The time that the file was last updated is returned with the dict
+    as a pair.
     """
-    day = 60 * 60 * 24
     if jsonf is None:
         jsonf = _sched_json_file
     try:
-        data = json.loads(open(jsonf).read())
+        data = nflgame.decoder.loads(open(jsonf).read())
     except IOError:
-        return OrderedDict()
+        return OrderedDict(), datetime.datetime.utcfromtimestamp(0)
 
     d = OrderedDict()
     for gsis_id, info in data.get('games', []):
         d[gsis_id] = info
     last_updated = datetime.datetime.utcfromtimestamp(data.get('time', 0))
-
-    if (datetime.datetime.utcnow() - last_updated).total_seconds() >= day:
-        # Only try to update if we can write to the schedule file.
-        if os.access(jsonf, os.W_OK):
-            import nflgame.live
-            import nflgame.update_sched
-            year, week = nflgame.live.current_year_and_week()
-            phase = nflgame.live._cur_season_phase
-            nflgame.update_sched.update_week(d, year, phase, week)
-            nflgame.update_sched.write_schedule(jsonf, d)
-            last_updated = datetime.datetime.now()
     return d, last_updated
 
+
+def _should_refresh(jsonf=None):
+    """
+    Returns true if the schedule is more than a day old and may be updated
+    from NFL.com at import time. The schedule is only updated if we can
+    write to the schedule file.
+    """
+    day = 60 * 60 * 24
+    if jsonf is None:
+        jsonf = _sched_json_file
+    if offline or refresh_mode == 'never':
+        return False
+    if (datetime.datetime.utcnow() - last_updated).total_seconds() < day:
+        return False
+    return os.access(jsonf, os.W_OK)
+
+
+def _refresh(jsonf):
+    global games, last_updated
+
+    from nflgame import live, update_sched
+
+    with _refresh_lock:
+        sched = OrderedDict(games)
+        year, week = live.current_year_and_week()
+        phase = live._cur_season_phase
+        update_sched.update_week(sched, year, phase, week)
+        if _exiting.is_set():
+            return
+        update_sched.write_schedule(jsonf, sched)
+        games, last_updated = sched, datetime.datetime.utcnow()
+
+
+def _refresh_quietly(jsonf):
+    if _exiting.is_set():
+        return
+    try:
+        _refresh(jsonf)
+    except Exception:
+        pass
+
+
+def _join_refresh():
+    """
+    Waits up to `nflgame.sched.exit_wait` seconds for an update on a
+    daemon thread to finish, and then tells it to give up. This runs when
+    the interpreter exits, since a daemon thread that is still running
+    while the interpreter is torn down dies with a traceback or worse.
+    """
+    if _refresh_thread is not None:
+        _refresh_thread.join(exit_wait)
+    _exiting.set()
+
+
+def refresh(jsonf=None, wait=True):
+    """
+    Updates the schedule with the current week of games from NFL.com
+    and writes it to jsonf, which defaults to the schedule.json file that
+    comes with nflgame. `nflgame.sched.games` is replaced with the updated
+    schedule, rather than changed in place, so that code iterating over
+    the old schedule is not disturbed.
+
+    If wait is false, then the update happens on a daemon thread and the
+    thread is returned. Errors on that thread are ignored. If an update is
+    already running on a thread, that thread is returned instead of
+    starting another.
+
+    A RuntimeError is raised if `nflgame.sched.offline` is true.
+    """
+    global _refresh_thread
+
+    if offline:
+        raise RuntimeError('Cannot update the schedule in offline mode.')
+    if jsonf is None:
+        jsonf = _sched_json_file
+    if wait:
+        _refresh(jsonf)
+        return None
+    if _refresh_thread is None or not _refresh_thread.is_alive():
+        if _refresh_thread is None:
+            atexit.register(_join_refresh)
+        _refresh_thread = threading.Thread(target=_refresh_quietly,
+                                           args=(jsonf,))
+        _refresh_thread.daemon = True
+        _refresh_thread.start()
+    return _refresh_thread
+
+
+class _Index (object):
+    """
+    Secondary indexes over the schedule, used to find games matching
+    search criteria without scanning every game in the schedule.
+
+    Each index maps a key to a list of GSIS ids in schedule order. The
+    keys are (year, season_type, week), (year, season_type), season_type,
+    team (home or away), home team, away team and (home, away).
+
+    The kickoff time of every game is also computed, in UTC, the first time
+    it is needed (which requires pytz), along with a list of games sorted
+    by kickoff time.
+    """
+    def __init__(self, sched):
+        self.sched = sched
+        self.size = len(sched)
+        self.kickoffs = None
+        self.by_kickoff = None
+        self.position = {}
+        self.by_week = {}
+        self.by_season = {}
+        self.by_kind = {}
+        self.by_team = {}
+        self.by_home = {}
+        self.by_away = {}
+        self.by_matchup = {}
+        for i, (gsis_id, info) in enumerate(sched.iteritems()):
+            y, t, w = info['year'], info['season_type'], info['week']
+            h, a = info['home'], info['away']
+            self.position[gsis_id] = i
+            self.by_week.setdefault((y, t, w), []).append(gsis_id)
+            self.by_season.setdefault((y, t), []).append(gsis_id)
+            self.by_kind.setdefault(t, []).append(gsis_id)
+            self.by_team.setdefault(h, []).append(gsis_id)
+            if a != h:
+                self.by_team.setdefault(a, []).append(gsis_id)
+            self.by_home.setdefault(h, []).append(gsis_id)
+            self.by_away.setdefault(a, []).append(gsis_id)
+            self.by_matchup.setdefault((h, a), []).append(gsis_id)
+
+    def _compute_kickoffs(self):
+        kickoffs = {}
+        for gsis_id, info in self.sched.iteritems():
+            kickoffs[gsis_id] = _kickoff(info)
+        self.by_kickoff = sorted((t, gsis_id)
+                                 for gsis_id, t in kickoffs.iteritems())
+        self.kickoffs = kickoffs
+
+    def kickoff(self, gsis_id):
+        """Returns the kickoff time of the game gsis_id in UTC."""
+        if self.kickoffs is None:
+            self._compute_kickoffs()
+        return self.kickoffs[gsis_id]
+
+    def starting_between(self, start, end):
+        """
+        Returns a list of GSIS ids of games with a kickoff time in the
+        interval [start, end), sorted by kickoff time.
+        """
+        if self.by_kickoff is None:
+            self._compute_kickoffs()
+        lo = bisect.bisect_left(self.by_kickoff, (start,))
+        hi = bisect.bisect_left(self.by_kickoff, (end,))
+        return [gsis_id for _, gsis_id in self.by_kickoff[lo:hi]]
+
+    def is_stale(self, sched):
+        """
+        Returns true if this index no longer describes sched. Only a
+        change in the number of games is detected, so callers that change
+        existing entries in place should call `nflgame.sched.reindex`.
+        """
+        return sched is not self.sched or len(sched) != self.size
+
+    def candidates(self, year=None, week=None, home=None, away=None,
+                   kind='REG'):
+        """
+        Returns a list of GSIS ids, in no particular order, that includes
+        every game matching the criteria given. The list may also contain
+        games that don't match, so each candidate must still be checked.
+        The parameters have the same meaning as in `nflgame.games`.
+        """
+        years = year if isinstance(year, list) else [year]
+        weeks = week if isinstance(week, list) else [week]
+        if year is None:
+            by_time = [self.by_kind.get(kind, [])]
+        elif week is None:
+            by_time = [self.by_season.get((y, kind), []) for y in years]
+        else:
+            by_time = [self.by_week.get((y, kind, w), [])
+                       for y in years for w in weeks]
+
+        if home is not None and away is not None and home == away:
+            by_team = [self.by_team.get(home, [])]
+        elif home is not None and away is not None:
+            by_team = [self.by_matchup.get((home, away), [])]
+        elif home is not None:
+            by_team = [self.by_home.get(home, [])]
+        elif away is not None:
+            by_team = [self.by_away.get(away, [])]
+        else:
+            by_team = None
+
+        if by_team is not None \
+                and sum(map(len, by_team)) < sum(map(len, by_time)):
+            return [gsis_id for ids in by_team for gsis_id in ids]
+        return [gsis_id for ids in by_time for gsis_id in ids]
+
+_index = None
+
+
+def _kickoff(info):
+    """
+    Computes the kickoff time of the game described by the schedule entry
+    info as a timezone aware `datetime.datetime` in UTC. This requires
+    pytz to be installed.
+    """
+    import pytz
+
+    hour, minute = info['time'].strip().split(':')
+    d = datetime.datetime(int(info['eid'][:4]), info['month'], info['day'],
+                          (int(hour) + 12) % 24, int(minute))
+    return pytz.timezone('US/Eastern').localize(d).astimezone(pytz.utc)
+
+
+def kickoff(info):
+    """
+    Returns the kickoff time of the game described by the schedule entry
+    info as a timezone aware `datetime.datetime` in UTC. Kickoff times of
+    games in `nflgame.sched.games` are computed once and remembered.
+
+    This requires pytz to be installed.
+    """
+    if games.get(info['eid']) is info:
+        return index().kickoff(info['eid'])
+    return _kickoff(info)
+
+
+def starting_between(start, end):
+    """
+    Returns a list of schedule entries for games with a kickoff time in the
+    interval [start, end), sorted by kickoff time. start and end must be
+    timezone aware `datetime.datetime` values. For example, to find games
+    starting in the next 30 minutes::
+
+        now = datetime.datetime.now(pytz.utc)
+        later = now + datetime.timedelta(minutes=30)
+        infos = nflgame.sched.starting_between(now, later)
+
+    This requires pytz to be installed.
+    """
+    return [games[gsis_id]
+            for gsis_id in index().starting_between(start, end)]
+
+
+def index():
+    """
+    Returns the secondary indexes of `nflgame.sched.games`, building them
+    if they don't exist yet or if the schedule has changed size.
+    """
+    global _index
+
+    if _index is None or _index.is_stale(games):
+        _index = _Index(games)
+    return _index
+
+
+def reindex():
+    """
+    Rebuilds the secondary indexes of `nflgame.sched.games`. This should be
+    called after entries in the schedule are changed in place.
+    """
+    global _index
+
+    _index = _Index(games)
+
 games, last_updated = _create_schedule()
+if _should_refresh():
+    refresh(wait=(refresh_mode == 'sync'))
 
 __pdoc__['nflgame.sched.games'] = """
 An ordered dict of schedule data, where games are ordered by the date
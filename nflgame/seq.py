@@ -1,16 +1,32 @@
-import functools
+import heapq
 import itertools
 import operator
 
 from nflgame import OrderedDict
 from nflgame import statmap
 
+
+def _in(a, b):
+    return a in b
+
+
+def _between(a, b):
+    return b[0] <= a <= b[1]
+
+
+def _call(a, b):
+    return b(a)
+
+
 _BUILTIN_PREDS = {
     '__lt': operator.lt,
     '__le': operator.le,
     '__ne': operator.ne,
     '__ge': operator.ge,
     '__gt': operator.gt,
+    '__in': _in,
+    '__between': _between,
+    '__contains': operator.contains,
 }
 """
 A dictionary of suffixes to predicates that can be used in Gen.filter.
@@ -24,8 +40,55 @@ Is equivalent to::
     players.filter(receiving_rec__gt=0)
 
 (Django users should feel right at home.)
+
+The `__in` suffix tests whether a field is in a collection of values, e.g.,
+`team__in=['NE', 'NYJ']`. The `__between` suffix takes a pair `(lo, hi)`
+and tests whether a field is in the closed interval `[lo, hi]`. The
+`__contains` suffix tests whether a field contains a value, e.g.,
+`desc__contains='TOUCHDOWN'`.
 """
 
+_FUNCTION = type(lambda x: x)
+
+
+def _compile_pred(field, value):
+    """
+    Returns a predicate for Gen.filter that tests items against the
+    criterion `field=value`, with the field name and any suffix resolved
+    once.
+    """
+    test = None
+    for suffix, p in _BUILTIN_PREDS.iteritems():
+        if field.endswith(suffix):
+            field, test = field[:-len(suffix)], p
+            break
+    if test is None:
+        if isinstance(value, _FUNCTION):
+            test = _call
+        else:
+            test = operator.eq
+    elif test is _in:
+        try:
+            value = frozenset(value)
+        except TypeError:
+            pass
+
+    def pred(item):
+        a = getattr(item, field, None)
+        return a is not None and test(a, value)
+    return pred
+
+
+def _compile_filter(kwargs):
+    """
+    Compiles the criteria given to Gen.filter into a single predicate.
+    The predicate stops at the first criterion that an item fails.
+    """
+    preds = [_compile_pred(k, v) for k, v in kwargs.iteritems()]
+    if len(preds) == 1:
+        return preds[0]
+    return lambda item: all(p(item) for p in preds)
+
 
 class Gen (object):
     """
@@ -72,34 +135,26 @@ class Gen (object):
 
             players.filter(receiving_rec__gt=0)
 
-        Other suffixes includes gt, le, lt, ne, ge, etc.
+        Other suffixes includes gt, le, lt, ne, ge, in, between and
+        contains. (See `nflgame.seq._BUILTIN_PREDS`.)
 
         (Django users should feel right at home.)
+
+        The criteria are compiled into a single predicate once, when filter
+        is called.
         """
-        preds = []
-        for k, v in kwargs.iteritems():
-            def pred(field, value, item):
-                for suffix, p in _BUILTIN_PREDS.iteritems():
-                    if field.endswith(suffix):
-                        f = field[:field.index(suffix)]
-                        if not hasattr(item, f) or getattr(item, f) is None:
-                            return False
-                        return p(getattr(item, f), value)
-                if not hasattr(item, field) or getattr(item, field) is None:
-                    return False
-                if isinstance(value, type(lambda x: x)):
-                    return value(getattr(item, field))
-                return getattr(item, field) == value
-            preds.append(functools.partial(pred, k, v))
-
-        gen = itertools.ifilter(lambda item: all([f(item) for f in preds]),
-                                self)
+        gen = itertools.ifilter(_compile_filter(kwargs), self)
         return self.__class__(gen)
 
     def limit(self, n):
         """
         Limit the sequence to N items.
+
+        When the sequence was just sorted, only the first N items of the
+        sort are selected with a heap, instead of sorting every item.
         """
+        if isinstance(self.__iter, _Sorted):
+            return self.__class__(self.__iter.limit(n))
         return self.__class__(itertools.islice(self, n))
 
     def sort(self, field, descending=True):
@@ -108,13 +163,91 @@ class Gen (object):
         a property on an item in the sequence. If descending is false, items
         will be sorted in order from least to greatest.
 
-        Note that if field does not exist in any item being sorted, a
-        KeyError will be raised.
+        field may also be a list of fields, in which case items are sorted
+        by the first field, then ties are broken by the second field and so
+        on. Items that are still tied keep their order in the sequence.
+
+        Items without a field are sorted as if its value were 0.
+
+        Sorting is done the first time the sorted sequence is used, and only
+        once. If the sequence is limited with `limit` first, then only the
+        items that are kept are sorted.
         """
-        def attrget(item):
-            return getattr(item, field, 0)
+        if isinstance(field, basestring):
+            def attrget(item):
+                return getattr(item, field, 0)
+        else:
+            fields = tuple(field)
+
+            def attrget(item):
+                return tuple(getattr(item, f, 0) for f in fields)
 
-        return self.__class__(sorted(self, reverse=descending, key=attrget))
+        return self.__class__(_Sorted(self, attrget, descending))
+
+    def group_by(self, *keys):
+        """
+        Groups the items in the sequence by the keys given, which are used
+        to compute aggregates with the `agg` method of the value returned.
+        For example, to find rushing yards and the number of plays by team
+        by week::
+
+            def week(play):
+                return play.drive.game.schedule['week']
+
+            plays = nflgame.combine_plays(nflgame.games(2012))
+            groups = plays.group_by('team', week).agg(rushing_yds=sum,
+                                                      plays='count')
+            for (team, week), row in groups.iteritems():
+                print team, week, row['rushing_yds'], row['plays']
+
+        Each key is either the name of a field, which may be a dotted path
+        like `drive.game.eid`, or a function of an item. Items without a
+        field are grouped under None.
+
+        Nothing is computed until `agg` is called. It then iterates over the
+        sequence once, so it works on sequences that can only be iterated
+        over once.
+        """
+        return Groups(self, keys)
+
+    def cached(self):
+        """
+        Returns this sequence in a form that can be iterated over more than
+        once. Sequences built by filter, limit and similar methods can
+        normally only be iterated over once, since they pull items from the
+        sequence they were built from.
+
+        The items are pulled from the original sequence the first time they
+        are needed and remembered, so the work that produces them is done
+        only once, and only as far as the items are used. A cached
+        sequence can also be reversed, indexed and given to len.
+
+        If this sequence can already be iterated over more than once, it is
+        returned as is.
+        """
+        if self.__iter is None \
+                or isinstance(self.__iter, (list, tuple, OrderedDict,
+                                            _Cache, _Sorted)):
+            return self
+        return self.__class__(_Cache(self.__iter))
+
+    def __items(self):
+        """
+        Returns the items of this sequence as an object that supports len,
+        indexing and reversal. A TypeError is raised if this sequence can
+        only be iterated over once, since counting or indexing its items
+        would consume them.
+        """
+        it = self.__iter
+        if it is None:
+            return []
+        if isinstance(it, OrderedDict):
+            return it.values()
+        if not isinstance(it, (list, tuple, _Cache, _Sorted)):
+            raise TypeError('This sequence can only be iterated over once. '
+                            'Use its cached method to count, index or '
+                            'reverse it.')
+        return it
 
     def __str__(self):
         """Returns a list of items in the sequence."""
@@ -130,7 +263,253 @@ class Gen (object):
 
     def __reversed__(self):
         """Satisfy the built in reversed."""
-        return reversed(self.__iter)
+        return reversed(self.__items())
+
+    def __len__(self):
+        """
+        Returns the number of items in the sequence. This is only
+        supported by sequences that can be iterated over more than once,
+        such as the ones returned by `cached`.
+        """
+        if isinstance(self.__iter, OrderedDict):
+            return len(self.__iter)
+        return len(self.__items())
+
+    def __getitem__(self, i):
+        """
+        Returns the item at index i, or a sequence of the items in a slice.
+        Like len, this is only supported by sequences that can be iterated
+        over more than once.
+        """
+        if isinstance(i, slice):
+            return self.__class__(self.__items()[i])
+        return self.__items()[i]
+
+    def __nonzero__(self):
+        """
+        Sequences are always true, as they have always been, so that
+        testing one never consumes it.
+        """
+        return True
+
+
+def _mean_step(s, v):
+    return (s[0] + v, s[1] + 1)
+
+
+def _mean_result(s):
+    return float(s[0]) / s[1]
+
+
+def _max_step(s, v):
+    return v if s is None or v > s else s
+
+
+def _min_step(s, v):
+    return v if s is None or v < s else s
+
+
+def _identity(s):
+    return s
+
+
+_AGGREGATES = {
+    'sum': (0, operator.add, _identity),
+    'count': (0, lambda s, v: s + 1, _identity),
+    'max': (None, _max_step, _identity),
+    'min': (None, _min_step, _identity),
+    'mean': ((0, 0), _mean_step, _mean_result),
+}
+"""
+The aggregates that can be computed by `nflgame.seq.Groups.agg`. Each is
+a triple of an initial state, a function that adds a value to a state and
+a function that turns the final state into a result.
+"""
+
+_AGGREGATE_BUILTINS = {sum: 'sum', len: 'count', max: 'max', min: 'min'}
+
+
+class Groups (object):
+    """
+    Groups is a sequence grouped by one or more keys, as returned by
+    `nflgame.seq.Gen.group_by`.
+    """
+    def __init__(self, items, keys):
+        self.items = items
+        self.keys = keys
+
+    def agg(self, **aggs):
+        """
+        Computes aggregates of each group in a single pass over the
+        sequence. Each keyword argument names an aggregate of the field
+        with the same name. Its value says how to aggregate it, and is one
+        of `sum`, `max`, `min`, `count` or `mean`, either as a string or
+        the builtin function (with `len` standing for `count`). To compute
+        an aggregate of a different field, give a pair of the aggregate and
+        the field instead, e.g., `longest=(max, 'rushing_yds')`.
+
+        Items without a field are aggregated as if its value were 0, and
+        `count` counts items.
+
+        Returns an OrderedDict mapping each group, in the order the groups
+        were first seen, to a dict of its aggregates. When grouping by a
+        single key, groups are the values of that key. Otherwise, groups
+        are tuples of the values of every key.
+        """
+        getters = [_getter(k) for k in self.keys]
+        specs = []
+        for name, how in aggs.iteritems():
+            field = name
+            if isinstance(how, tuple):
+                how, field = how
+            how = _AGGREGATE_BUILTINS.get(how, how)
+            if how not in _AGGREGATES:
+                raise ValueError('Unknown aggregate "%s" for "%s". Valid '
+                                 'aggregates are %s.'
+                                 % (how, name, ', '.join(sorted(_AGGREGATES))))
+            if how == 'count':
+                # Counting never looks at the field, which may be costly
+                # to get (e.g., the plays of a drive).
+                field = None
+            specs.append((name, field) + _AGGREGATES[how])
+
+        groups = OrderedDict()
+        for item in self.items:
+            if len(getters) == 1:
+                key = getters[0](item)
+            else:
+                key = tuple(get(item) for get in getters)
+            states = groups.get(key)
+            if states is None:
+                states = groups[key] = [init for _, _, init, _, _ in specs]
+            for i, (_, field, _, step, _) in enumerate(specs):
+                v = 0 if field is None else getattr(item, field, 0)
+                states[i] = step(states[i], v)
+
+        for key, states in groups.iteritems():
+            groups[key] = dict((name, result(state))
+                               for (name, _, _, _, result), state
+                               in zip(specs, states))
+        return groups
+
+
+def _getter(key):
+    """
+    Returns a function that computes the group key of an item, where key
+    is either a function or a (possibly dotted) field name.
+    """
+    if callable(key):
+        return key
+    get = operator.attrgetter(key)
+
+    def getter(item):
+        try:
+            return get(item)
+        except AttributeError:
+            return None
+    return getter
+
+
+class _Cache (object):
+    """
+    _Cache is an iterable that pulls items from another iterable the
+    first time they are needed and remembers them, so it can be iterated
+    over any number of times (even at the same time) while the source is
+    only iterated over once.
+    """
+    def __init__(self, iterable):
+        self._source = iter(iterable)
+        self._items = []
+
+    def _pull(self):
+        """
+        Pulls the next item from the source into the cache. Returns false
+        if the source is exhausted.
+        """
+        if self._source is None:
+            return False
+        try:
+            self._items.append(next(self._source))
+            return True
+        except StopIteration:
+            self._source = None
+            return False
+
+    def _all(self):
+        while self._pull():
+            pass
+        return self._items
+
+    def __iter__(self):
+        i = 0
+        while i < len(self._items) or self._pull():
+            yield self._items[i]
+            i += 1
+
+    def __reversed__(self):
+        return reversed(self._all())
+
+    def __len__(self):
+        return len(self._all())
+
+    def __getitem__(self, i):
+        if isinstance(i, slice) or i < 0:
+            return self._all()[i]
+        while i >= len(self._items) and self._pull():
+            pass
+        return self._items[i]
+
+
+class _Sorted (object):
+    """
+    _Sorted is an iterable of the items of another iterable in sorted
+    order. The items are sorted the first time it is iterated over, and
+    the result is remembered.
+
+    If only the first n items are wanted, they are selected with
+    `heapq.nlargest` or `heapq.nsmallest`, which are equivalent to sorting
+    and slicing but cost O(N log n) time and O(n) memory.
+    """
+    def __init__(self, iterable, key, descending, n=None):
+        self.iterable = iterable
+        self.key = key
+        self.descending = descending
+        self.n = n
+        self._items = None
+
+    def limit(self, n):
+        """Returns a _Sorted of only the first n items of this one."""
+        if self._items is not None:
+            return self._items[:n]
+        if self.n is not None:
+            n = min(n, self.n)
+        return _Sorted(self.iterable, self.key, self.descending, n)
+
+    def _sorted(self):
+        if self._items is None:
+            if self.n is None:
+                self._items = sorted(self.iterable, key=self.key,
+                                     reverse=self.descending)
+            elif self.descending:
+                self._items = heapq.nlargest(self.n, self.iterable,
+                                             key=self.key)
+            else:
+                self._items = heapq.nsmallest(self.n, self.iterable,
+                                              key=self.key)
+            self.iterable = None
+        return self._items
+
+    def __iter__(self):
+        return iter(self._sorted())
+
+    def __reversed__(self):
+        return reversed(self._sorted())
+
+    def __len__(self):
+        return len(self._sorted())
+
+    def __getitem__(self, i):
+        return self._sorted()[i]
 
 
 class GenDrives (Gen):
@@ -183,21 +562,32 @@ class GenPlays (Gen):
     def players(self):
         """
         Returns the combined player stats for every play in the sequence.
+
+        The stats of each player are summed in place into a single copy of
+        that player with a `nflgame.player.Accumulator`, rather than
+        creating a new player for every play the player appears in.
         """
-        players = OrderedDict()
+        from nflgame.player import Accumulator
+
+        acc = Accumulator()
         for play in self:
-            for player in play.players:
-                if player.playerid not in players:
-                    players[player.playerid] = player
-                else:
-                    players[player.playerid] += player
-        return GenPlayerStats(players)
+            acc.add_all(play.players)
+        return acc.players()
 
 
 class GenPlayerStats (Gen):
     """
     GenPlayerStats implements a sequence type and provides a convenient API for
     searching sets of player statistics.
+
+    Looking players up by name or identifier is fast for sequences that
+    can be iterated over more than once (see `nflgame.seq.Gen.cached`).
+    When the sequence is backed by an OrderedDict keyed by player id, which
+    is how nflgame builds sequences of player statistics, `playerid` is a
+    dict lookup. Otherwise, an index is built the first time it's needed.
+    Each index belongs to one sequence, and is rebuilt if the number of
+    items in the sequence changes. Sequences derived from this one (e.g.,
+    with filter) build their own indexes.
     """
     def name(self, name):
         """
@@ -207,6 +597,9 @@ class GenPlayerStats (Gen):
         Note that NFL GameCenter formats their names like "T.Brady" and
         "W.Welker". Thus, `name` should also be in this format.
         """
+        index = self.__index('name')
+        if index is not None:
+            return index.get(name)
         for p in self:
             if p.name == name:
                 return p
@@ -221,11 +614,39 @@ class GenPlayerStats (Gen):
         If no such player with the given identifier is found, None is
         returned.
         """
+        players = self._Gen__iter
+        if isinstance(players, OrderedDict):
+            return players.get(playerid)
+        index = self.__index('playerid')
+        if index is not None:
+            return index.get(playerid)
         for p in self:
             if p.playerid == playerid:
                 return p
         return None
 
+    def __index(self, attr):
+        """
+        Returns a dict mapping the value of attr to the first player in
+        this sequence with that value, or None if this sequence can only be
+        iterated over once.
+        """
+        try:
+            n = len(self)
+        except TypeError:
+            return None
+        try:
+            indexes = self.__indexes
+        except AttributeError:
+            indexes = self.__indexes = {}
+        size, index = indexes.get(attr, (None, None))
+        if size != n:
+            index = {}
+            for p in self:
+                index.setdefault(getattr(p, attr), p)
+            indexes[attr] = (n, index)
+        return index
+
     def touchdowns(self):
         """
         touchdowns is a convenience method for returning a Players
@@ -233,8 +654,8 @@ class GenPlayerStats (Gen):
         """
         def gen():
             for p in self:
-                for f in p.__dict__:
-                    if f.endswith('tds') and p.__dict__[f] > 0:
+                for f, v in p.stats.iteritems():
+                    if f.endswith('tds') and v > 0:
                         yield p
                         break
         return self.__class__(gen())
@@ -321,9 +742,10 @@ class GenPlayerStats (Gen):
             if p.player is not None:
                 d['pos'] = p.player.position
 
+            stats = p.stats
             for field in fields:
-                if field in p.__dict__:
-                    d[field] = p.__dict__[field]
+                if field in stats:
+                    d[field] = stats[field]
                 else:
                     d[field] = ""
             rows.append(d)
@@ -337,10 +759,8 @@ class GenPlayerStats (Gen):
         Adds two sequences of players by combining repeat players and summing
         their statistics.
         """
-        players = OrderedDict()
-        for p in itertools.chain(self, other):
-            if p.playerid not in players:
-                players[p.playerid] = p
-            else:
-                players[p.playerid] += p
-        return GenPlayerStats(players)
+        from nflgame.player import Accumulator
+
+        acc = Accumulator()
+        acc.add_all(itertools.chain(self, other))
+        return acc.players()
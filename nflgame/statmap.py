@@ -40,6 +40,7 @@ long contains a verbatim description from nflgsis.com. Some of the information
 clearly references legacy systems, but alas, it is included as it adds to the
 context of each statistical category.
 """
+import threading
 
 
 def values(category_id, yards):
@@ -47,9 +48,20 @@ def values(category_id, yards):
     Returns a dictionary of field names to statistical values for a
     particular category id defined in idmap.
     """
-    assert category_id in idmap, \
+    assert category_id in dispatch, \
         'Category identifier %d is not known.' % category_id
-    info = idmap[category_id]
+    return expand(dispatch[category_id], yards)
+
+
+def expand(entry, yards):
+    """
+    Returns a dictionary of field names to statistical values for an
+    entry in `nflgame.statmap.dispatch`. This is the same as `values`,
+    but skips looking up the category id.
+    """
+    yds, counts = entry
+    if yds is None:
+        return dict(counts)
     try:
         yards = int(yards)
     except ValueError:
@@ -57,14 +69,37 @@ def values(category_id, yards):
     except TypeError:
         # Catch errors if yards is a NoneType
         yards = 0
-
-    vals = {}
-    if info['yds']:
-        vals[info['yds']] = yards
-    for f in info['fields']:
-        vals[f] = info.get('value', 1)
+    vals = {yds: yards}
+    vals.update(counts)
     return vals
 
+
+def field_id(name):
+    """
+    Returns the position of the statistical field name in
+    `nflgame.statmap.fields`, adding it to the end of the registry if it
+    isn't there yet.
+    """
+    try:
+        return field_ids[name]
+    except KeyError:
+        with _fields_lock:
+            if name not in field_ids:
+                field_ids[name] = len(fields)
+                fields.append(name)
+            return field_ids[name]
+
+
+def _compile(idmap):
+    """
+    Compiles idmap into the table described by `nflgame.statmap.dispatch`.
+    """
+    table = {}
+    for category_id, info in idmap.iteritems():
+        counts = tuple((f, info.get('value', 1)) for f in info['fields'])
+        table[category_id] = (info['yds'] or None, counts)
+    return table
+
 categories = ("passing", "rushing", "receiving",
               "fumbles", "kicking", "punting", "kickret", "puntret",
               "defense", "penalty")
@@ -922,3 +957,32 @@ idmap = {
                 'ending in a touchback.',
     },
 }
+
+fields = []
+"""
+fields is a registry of every statistical field name that nflgame knows
+about. It starts with the fields and yardage fields in idmap, and fields
+found elsewhere (like the game statistics reported by GameCenter) are added
+as they are seen with `nflgame.statmap.field_id`. A field's position in
+this list never changes, so it can be used to identify the field compactly.
+"""
+
+field_ids = {}
+"""A dict mapping each name in `nflgame.statmap.fields` to its position."""
+
+_fields_lock = threading.Lock()
+
+for _info in (idmap[k] for k in sorted(idmap)):
+    for _name in [_info['yds']] + _info['fields']:
+        if _name:
+            field_id(_name)
+del _info, _name
+
+dispatch = _compile(idmap)
+"""
+dispatch is idmap compiled for expanding stat events quickly. It maps each
+category id to a pair `(yds, counts)`, where yds is the name of the field
+holding the yardage of the stat (or None) and counts is a tuple of
+`(field, value)` pairs. If idmap is changed, dispatch must be rebuilt with
+`nflgame.statmap._compile(idmap)`.
+"""
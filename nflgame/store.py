@@ -0,0 +1,400 @@
+"""
+The store module provides a binary encoding of parsed GameCenter JSON
+data that can be memory mapped and decoded lazily.
+
+Decoding the JSON data of a game is the most expensive part of creating a
+`nflgame.game.Game`, and most of the decoded data is never looked at. A
+store keeps the already parsed structure of many games in a single file,
+split into separately encoded pieces: the home and away team statistics,
+the scoring summary and each individual drive. The file is memory mapped,
+and each piece is only decoded when it is first accessed. So creating a
+game from a store and only looking at the score touches a handful of pages
+of the file.
+
+Stores are a cache. The gzipped JSON files (or the archives described in
+`nflgame.archive`) remain the source of truth, and a store can always be
+rebuilt from them with the `nflgame-build-store` script. The same script
+can also convert a game in a store back into JSON.
+
+Stores live in the same directory as the gzipped JSON files, with one store
+per season (e.g., `2012.store`) or one store for every game (`all.store`).
+They are encoded with Python's marshal module, which is specific to a
+version of Python. A store written by a different version of Python is
+ignored, in which case games are read from their JSON data as usual.
+
+The format of a store starts with an 8 byte magic string followed by a
+marshaled tuple identifying the version of Python that wrote it. Next come
+the encoded pieces of every game. Then comes the index, which is a
+marshaled dict mapping game identifiers to the location of the top-level
+piece of each game. Finally, the last 16 bytes of the file are the offset
+of the index as a big endian unsigned 64 bit integer followed by the magic
+string again.
+
+Each index entry also records the total number of bytes used by the
+pieces of the game.
+
+A piece is either a plain marshaled value or a node. A node is a marshaled
+triple `(keys, inline, refs)`, where `keys` is a list of the node's keys,
+`inline` is a dict of values that are cheap to decode right away and
+`refs` is a dict mapping keys to the location of another piece as a
+triple `(offset, length, is_node)`.
+
+A game loaded from a store must be exactly the same as one loaded from
+JSON, down to the order in which the keys of each dict are iterated over,
+since that order decides things like the order of players in a play.
+The order of a dict's keys depends on the order they were inserted in,
+which for a decoded JSON object is the order of the JSON document. So
+marshaled dicts are written with their items in the order of the JSON
+document, and marshal inserts them in that same order when it decodes
+them. Likewise, the keys of a node are listed in the order a dict built
+from the JSON document would iterate over them.
+"""
+from __future__ import absolute_import, division, print_function
+import argparse
+import collections
+import cStringIO
+import json
+import marshal
+import mmap
+import struct
+import sys
+
+import nflgame.archive
+import nflgame.datafile
+from nflgame.datafile import eprint
+
+_MAGIC = 'NFLGSTR2'
+"""The magic string at the start and end of every store."""
+
+_TRAILER = struct.Struct('>Q')
+"""The encoding of the index offset at the end of every store."""
+
+_LOCATION = struct.Struct('>QQ?')
+"""The encoding of the location of the top-level piece in `dumps`."""
+
+_SIZE = struct.Struct('<i')
+"""The encoding of the size of a marshaled list or tuple."""
+
+_VERSION = (tuple(sys.version_info[:2]), marshal.version)
+"""Identifies the encoding of marshaled data written by this process."""
+
+_DEPTH = 3
+"""
+How many levels of a game's JSON data are split into nodes. A depth of
+three splits the top-level document, the game data and its immediate
+children (home, away and drives), which means every drive is decoded on
+its own.
+"""
+
+
+class LazyDict (collections.Mapping):
+    """
+    LazyDict is a read only mapping over a node in a store. Values that
+    are stored by reference are decoded from the memory mapped file the
+    first time they are accessed and remembered afterwards.
+    """
+    def __init__(self, buf, keys, inline, refs):
+        self._buf = buf
+        self._keys = keys
+        self._inline = inline
+        self._refs = refs
+
+    def __getitem__(self, key):
+        # Games are shared between threads, so another thread may decode
+        # the same key at the same time. The value is added before its
+        # reference is removed, and whichever thread adds it first wins,
+        # so every thread sees the same value.
+        if key in self._inline:
+            return self._inline[key]
+        loc = self._refs.get(key)
+        if loc is None:
+            return self._inline[key]
+        value = self._inline.setdefault(key, _decode(self._buf, *loc))
+        self._refs.pop(key, None)
+        return value
+
+    def __contains__(self, key):
+        return key in self._inline or key in self._refs
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+
+def _decode(buf, offset, length, is_node):
+    value = marshal.loads(buf[offset:offset + length])
+    if not is_node:
+        return value
+    keys, inline, refs = value
+    return LazyDict(buf, keys, inline, refs)
+
+
+class _Items (list):
+    """
+    _Items is a JSON object decoded as a list of its `(key, value)` pairs
+    in the order of the JSON document.
+    """
+
+
+def _parse(raw):
+    """
+    Decodes the JSON document in the string raw, where every object is
+    decoded as an `_Items` list instead of a dict. A ValueError is raised
+    if raw isn't valid JSON.
+    """
+    return json.loads(raw, object_pairs_hook=_Items)
+
+
+def _marshal(value):
+    """
+    Returns value encoded with marshal, where every `_Items` list is
+    encoded as a dict with its items in the order of the list.
+
+    The pieces are encoded with version 0 of marshal's format, which
+    doesn't refer back to strings encoded earlier, so they can be joined.
+    """
+    if isinstance(value, _Items):
+        return '{%s0' % ''.join(_marshal(k) + _marshal(v) for k, v in value)
+    if isinstance(value, (list, tuple)):
+        return '%s%s%s' % ('[' if isinstance(value, list) else '(',
+                           _SIZE.pack(len(value)),
+                           ''.join(map(_marshal, value)))
+    return marshal.dumps(value, 0)
+
+
+def _encode(out, value, depth):
+    """
+    Writes value, which was decoded by `nflgame.store._parse`, to the
+    file out, splitting objects into nodes up to depth levels deep.
+    Returns the location of the piece written as a triple
+    `(offset, length, is_node)`.
+    """
+    if depth > 0 and isinstance(value, _Items):
+        inline, refs = _Items(), {}
+        for k, v in value:
+            if isinstance(v, _Items) and len(v) > 0:
+                refs[k] = _encode(out, v, depth - 1)
+            else:
+                inline.append((k, v))
+        keys = dict(value).keys()
+        blob, is_node = _marshal((keys, inline, refs)), True
+    else:
+        blob, is_node = _marshal(value), False
+    offset = out.tell()
+    out.write(blob)
+    return (offset, len(blob), is_node)
+
+
+def materialize(value):
+    """
+    Returns a copy of value with every LazyDict in it decoded and
+    converted to a plain dict.
+    """
+    if isinstance(value, collections.Mapping):
+        return dict((k, materialize(v)) for k, v in value.iteritems())
+    return value
+
+
+def dumps(raw):
+    """
+    Encodes the JSON document in the string raw in the same way that games
+    are encoded in a store, and returns the encoding as a string. The
+    string can be decoded lazily with `nflgame.store.loads`. A ValueError
+    is raised if raw isn't valid JSON.
+
+    This is useful for handing parsed game data from one process to
+    another, since the receiving process only pays for decoding the parts
+    of the game that it looks at.
+    """
+    out = cStringIO.StringIO()
+    loc = _encode(out, _parse(raw), _DEPTH)
+    out.write(_LOCATION.pack(*loc))
+    return out.getvalue()
+
+
+def loads(s):
+    """
+    Returns a LazyDict of the JSON document encoded in the string s by
+    `nflgame.store.dumps`.
+    """
+    offset, length, is_node = _LOCATION.unpack(s[-_LOCATION.size:])
+    return _decode(s, offset, length, is_node)
+
+
+class Store (object):
+    """
+    Store provides read access to the games in a single store file.
+    """
+    def __init__(self, fpath):
+        self.fpath = fpath
+        with open(fpath, 'rb') as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        tlen = _TRAILER.size + len(_MAGIC)
+        if self._buf[:len(_MAGIC)] != _MAGIC \
+                or self._buf[-len(_MAGIC):] != _MAGIC:
+            raise IOError('"%s" is not an nflgame store.' % fpath)
+        start = _TRAILER.unpack(self._buf[-tlen:-len(_MAGIC)])[0]
+        self.version = marshal.loads(self._buf[len(_MAGIC):start])
+        if self.version != _VERSION:
+            raise ValueError('"%s" was written by a different version of '
+                             'Python.' % fpath)
+        self.index = marshal.loads(self._buf[start:-tlen])
+
+    def __contains__(self, eid):
+        return eid in self.index
+
+    def load(self, eid):
+        """
+        Returns the top-level JSON document of the game identified by eid
+        as a LazyDict, or None if the game is not in this store. The
+        document is a mapping from eid to the game data, just like the
+        JSON data from NFL.com.
+        """
+        if eid not in self.index:
+            return None
+        offset, length, is_node = self.index[eid][:3]
+        return _decode(self._buf, offset, length, is_node)
+
+    def size(self, eid):
+        """
+        Returns the number of bytes used by the game identified by eid in
+        this store, or None if the game is not in this store.
+        """
+        if eid not in self.index:
+            return None
+        return self.index[eid][3]
+
+
+_stores = nflgame.datafile.SeasonFiles(
+    'store', Store, (EnvironmentError, EOFError, ValueError, TypeError))
+"""
+The stores that have been opened. Stores that can't be read by this
+version of Python are treated as if they didn't exist.
+"""
+
+
+def store_path(season=None, store_dir=None):
+    """
+    Returns the path of the store for season. If season is None, then
+    the path of the store containing every game is returned.
+    """
+    return _stores.path(season, store_dir)
+
+
+def find(eid):
+    """
+    Returns the store containing the game identified by eid, or None
+    if no store contains it.
+    """
+    return _stores.find(eid)
+
+
+def contains(eid):
+    """Returns true if the game identified by eid is in a store."""
+    return find(eid) is not None
+
+
+def load(eid):
+    """
+    Returns the lazily decoded top-level JSON document of the game
+    identified by eid from a store, or None if no store contains it.
+    """
+    store = find(eid)
+    if store is None:
+        return None
+    return store.load(eid)
+
+
+def reset():
+    """
+    Forgets every store that has been opened, so that stores built or
+    removed since are picked up on the next load.
+    """
+    _stores.reset()
+
+
+def to_json(eid):
+    """
+    Converts the game identified by eid in a store back to JSON data.
+    Returns None if no store contains the game.
+    """
+    doc = load(eid)
+    if doc is None:
+        return None
+    return json.dumps(materialize(doc), separators=(',', ':'))
+
+
+def build(fpath, eids):
+    """
+    Writes a new store to fpath containing the games identified by eids.
+    The data for each game is read through `nflgame.game._get_json_data`,
+    so archives and gzipped JSON files are both used as sources. Games
+    without data are skipped.
+    """
+    import nflgame.game
+
+    index = {}
+    with nflgame.datafile.atomic_write(fpath) as out:
+        out.write(_MAGIC)
+        out.write(marshal.dumps(_VERSION))
+        for eid in sorted(eids):
+            raw = nflgame.game._get_json_data(eid)
+            if raw is None:
+                continue
+            start = out.tell()
+            loc = _encode(out, _parse(raw), _DEPTH)
+            index[eid] = loc + (out.tell() - start,)
+        start = out.tell()
+        out.write(marshal.dumps(index))
+        out.write(_TRAILER.pack(start))
+        out.write(_MAGIC)
+    return len(index)
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Builds memory mapped stores of pre-parsed game data '
+                    'from nflgame\'s GameCenter JSON data, or converts '
+                    'games in a store back to JSON.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    aa = parser.add_argument
+    aa('--output-dir', type=str, default=nflgame.datafile.data_dir,
+       help='The directory to write stores to. Stores are only read from '
+            'the directory that comes with nflgame.')
+    aa('--per-season', action='store_true',
+       help='When set, one store is written for each season instead of '
+            'a single store containing every game.')
+    aa('--to-json', type=str, default=None, metavar='EID',
+       help='When set, the game with this identifier is read from a store '
+            'and written to stdout as JSON. No store is built.')
+    args = parser.parse_args()
+
+    if args.to_json is not None:
+        data = to_json(args.to_json)
+        if data is None:
+            eprint('No store contains the game "%s".' % args.to_json)
+            sys.exit(1)
+        print(data)
+        return
+
+    nflgame.datafile.require_writable(args.output_dir, 'a store')
+
+    eids = nflgame.archive.known_eids()
+    if args.per_season:
+        groups = [(store_path(s, args.output_dir), group)
+                  for s, group in nflgame.datafile.by_season(eids)]
+    else:
+        groups = [(store_path(None, args.output_dir), eids)]
+
+    for fpath, group in groups:
+        n = build(fpath, group)
+        print('Wrote %d games to %s' % (n, fpath))
+    reset()
+
+if __name__ == '__main__':
+    run()
@@ -9,6 +9,7 @@ import xml.dom.minidom as xml
 import re 
 
 import nflgame
+import nflgame.datafile
 from nflgame import OrderedDict
 
 DETAILED_STATS_START_YEAR = 2009
@@ -163,9 +164,9 @@ def write_schedule(fpath, sched):
     alist = []
     for gsis_id in sorted(sched):
         alist.append([gsis_id, sched[gsis_id]])
-    json.dump({'time': time.time(), 'games': alist},
-              open(fpath, 'w+'), indent=1, sort_keys=True,
-              separators=(',', ': '))
+    with nflgame.datafile.atomic_write(fpath, 'w') as f:
+        json.dump({'time': time.time(), 'games': alist},
+                  f, indent=1, sort_keys=True, separators=(',', ': '))
 
 def eprint(*args, **kwargs):
     kwargs['file'] = sys.stderr
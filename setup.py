@@ -59,10 +59,15 @@ setup(
     platforms='ANY',
     packages=['nflgame'],
     package_data={'nflgame': ['players.json', 'schedule.json',
-                              'gamecenter-json/*.json.gz']},
+                              'gamecenter-json/*.json.gz',
+                              'gamecenter-json/*.pack']},
     data_files=[('share/doc/nflgame', ['README.md', 'CHANGELOG', 'UNLICENSE',
                                        'longdesc.rst']),
                 ('share/doc/nflgame/doc', glob('doc/nflgame/*.html'))],
-    scripts=['scripts/nflgame-update-players'],
+    scripts=['scripts/nflgame-update-players',
+             'scripts/nflgame-build-archive',
+             'scripts/nflgame-build-store',
+             'scripts/nflgame-build-playtable',
+             'scripts/nflgame-build-cube'],
     install_requires=install_requires
 )